@@ -2,55 +2,95 @@ import streamlit as st
 from dataclasses import dataclass
 from typing import Annotated, Sequence, Optional
 
-from langchain.callbacks.base import BaseCallbackHandler
-from langchain_core.messages import SystemMessage
-from langchain_openai import ChatOpenAI
-from langgraph.checkpoint.memory import MemorySaver
-from langgraph.graph import START, END, StateGraph
-from langgraph.prebuilt import ToolNode, tools_condition
-from langgraph.graph.message import add_messages
-from langchain_core.messages import BaseMessage
-
-from tools import retriever_tool
-from tools import search, sql_executor_tool
-from PIL import Image
-from io import BytesIO
+from utils.checkpoint import create_checkpointer
+from utils.context_window import manage_context
+from utils.startup import timed
+
+with timed("langchain_core, langgraph"):
+    from langchain_core.messages import SystemMessage
+    from langchain_core.runnables import RunnableConfig, RunnableLambda
+    from langgraph.graph import START, END, StateGraph
+    from langgraph.prebuilt import ToolNode, tools_condition
+    from langgraph.graph.message import add_messages
+    from langchain_core.messages import BaseMessage
+
+with timed("tools"):
+    from tools import retriever_tool
+    from tools import search, sql_executor_tool
+
 
 @dataclass
 class MessagesState:
     messages: Annotated[Sequence[BaseMessage], add_messages]
+    # Running summary of turns that were dropped from the context window
+    summary: str = ""
 
 
-memory = MemorySaver()
+# Conversation state per thread (one thread per browser session), bounded in size.
+memory = create_checkpointer(
+    sqlite_path=st.secrets.get("CHECKPOINT_SQLITE_PATH"),
+    max_threads=int(st.secrets.get("CHECKPOINT_MAX_THREADS", 500)),
+    max_messages=int(st.secrets.get("CHECKPOINT_MAX_MESSAGES", 60)),
+    idle_ttl=float(st.secrets.get("CHECKPOINT_IDLE_TTL", 6 * 60 * 60)),
+)
 
+# Token budget for the conversation history sent to the LLM on every step
+context_token_budget = int(st.secrets.get("CONTEXT_TOKEN_BUDGET", 6000))
+summary_token_budget = int(st.secrets.get("SUMMARY_TOKEN_BUDGET", 500))
 
-@dataclass
+
+def reset_thread(thread_id: str) -> None:
+    """Drops the stored conversation of ``thread_id``, if the checkpointer supports it."""
+    evict = getattr(memory, "evict_thread", None) or getattr(memory, "delete_thread", None)
+    if evict is not None:
+        evict(thread_id)
+
+
+@dataclass(frozen=True)
 class ModelConfig:
     model_name: str
     api_key: str
     base_url: Optional[str] = None
 
 
-model_configurations = {
-    "o3-mini": ModelConfig(
-        model_name="o3-mini", api_key=st.secrets["OPENAI_API_KEY"]
-    ),
-    "Grok 2": ModelConfig(
+@dataclass(frozen=True)
+class ModelProvider:
+    model_name: str
+    api_key_secret: str
+    base_url: Optional[str] = None
+
+
+# Only the provider of the selected model is resolved, so secrets of other providers are
+# never read (and may be absent).
+model_providers = {
+    "o3-mini": ModelProvider(model_name="o3-mini", api_key_secret="OPENAI_API_KEY"),
+    "Grok 2": ModelProvider(
         model_name="grok-2-latest",
-        api_key=st.secrets["XAI_API_KEY"],
+        api_key_secret="XAI_API_KEY",
         base_url="https://api.x.ai/v1",
     ),
-    "Qwen 2.5": ModelConfig(
+    "Qwen 2.5": ModelProvider(
         model_name="accounts/fireworks/models/qwen2p5-coder-32b-instruct",
-        api_key=st.secrets["FIREWORKS_API_KEY"],
+        api_key_secret="FIREWORKS_API_KEY",
         base_url="https://api.fireworks.ai/inference/v1",
     ),
-    "Gemini 2.0 Flash": ModelConfig(
+    "Gemini 2.0 Flash": ModelProvider(
         model_name="gemini-2.0-flash",
-        api_key=st.secrets["GEMINI_API_KEY"],
+        api_key_secret="GEMINI_API_KEY",
         base_url="https://generativelanguage.googleapis.com/v1beta/openai/",
     ),
 }
+
+
+def get_model_config(model_name: str) -> Optional[ModelConfig]:
+    provider = model_providers.get(model_name)
+    if provider is None:
+        return None
+    return ModelConfig(
+        model_name=provider.model_name,
+        api_key=st.secrets.get(provider.api_key_secret),
+        base_url=provider.base_url,
+    )
 sys_msg = SystemMessage(
     content="""You're an AI assistant specializing in data analysis with Snowflake SQL. When providing responses, strive to exhibit friendliness and adopt a conversational tone, similar to how a friend or tutor would communicate. Do not ask the user for schema or database details. You have access to the following tools:
     ALWAYS USE THE Database_Schema TOOL TO GET THE SCHEMA OF THE TABLE BEFORE GENERATING SQL CODE.
@@ -60,36 +100,102 @@ sys_msg = SystemMessage(
 )
 tools = [retriever_tool, search]
 
-def create_agent(callback_handler: BaseCallbackHandler, model_name: str) -> StateGraph:
-    config = model_configurations.get(model_name)
+
+@st.cache_resource(show_spinner=False)
+def get_http_client(base_url: Optional[str]):
+    """One pooled keep-alive HTTP client per provider, shared by every cached agent."""
+    import httpx
+
+    return httpx.Client(
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+    )
+
+
+@st.cache_resource(show_spinner=False)
+def get_async_http_client(base_url: Optional[str]):
+    """
+    Async counterpart of ``get_http_client``. Its connections belong to the background
+    event loop of ``utils.async_runtime``, the only loop the async agent path runs on.
+    """
+    import httpx
+
+    return httpx.AsyncClient(
+        limits=httpx.Limits(max_connections=20, max_keepalive_connections=10),
+    )
+
+
+def create_agent(model_name: str) -> StateGraph:
+    """
+    Returns the compiled agent graph for ``model_name``. Graphs are cached per model, so
+    per-request callbacks must be passed in the config at invoke time.
+    """
+    config = get_model_config(model_name)
     if not config:
         raise ValueError(f"Unsupported model name: {model_name}")
 
     if not config.api_key:
         raise ValueError(f"API key for model '{model_name}' is not set. Please check your environment variables or secrets configuration.")
 
+    return build_agent(config)
+
+
+@st.cache_resource(show_spinner=False)
+def build_agent(config: ModelConfig) -> StateGraph:
+    with timed(f"agent graph ({config.model_name})", kind="init"):
+        return _compile_agent(config)
+
+
+def _compile_agent(config: ModelConfig) -> StateGraph:
+    with timed("langchain_openai"):
+        from langchain_openai import ChatOpenAI
+
     llm = ChatOpenAI(
         model=config.model_name,
         api_key=config.api_key,
-        callbacks=[callback_handler],
         streaming=True,
         base_url=config.base_url,
+        http_client=get_http_client(config.base_url),
+        http_async_client=get_async_http_client(config.base_url),
         # temperature=0.1,
         default_headers={"HTTP-Referer": "https://snowchat.streamlit.app/", "X-Title": "Snowchat"},
     )
 
     llm_with_tools = llm.bind_tools(tools)
 
-    def llm_agent(state: MessagesState):
-        return {"messages": [llm_with_tools.invoke([sys_msg] + state.messages)]}
+    def context_manager(state: MessagesState):
+        """Keeps the history within the token budget before every LLM call."""
+        updates, summary = manage_context(
+            state.messages, state.summary, context_token_budget, summary_token_budget
+        )
+        if not updates:
+            return {"summary": summary}
+        return {"messages": updates, "summary": summary}
+
+    def prompt(state: MessagesState):
+        system = sys_msg
+        if state.summary:
+            system = SystemMessage(
+                content=f"{sys_msg.content}\nSummary of the earlier conversation:\n{state.summary}"
+            )
+        return [system] + state.messages
+
+    def llm_agent(state: MessagesState, config: RunnableConfig):
+        return {"messages": [llm_with_tools.invoke(prompt(state), config)]}
+
+    async def allm_agent(state: MessagesState, config: RunnableConfig):
+        return {"messages": [await llm_with_tools.ainvoke(prompt(state), config)]}
 
     builder = StateGraph(MessagesState)
-    builder.add_node("llm_agent", llm_agent)
+    builder.add_node("context_manager", context_manager)
+    # invoke() calls the sync LLM client, astream_events() the async one; in both modes
+    # ToolNode runs the tool calls of one LLM turn concurrently.
+    builder.add_node("llm_agent", RunnableLambda(llm_agent, afunc=allm_agent, name="llm_agent"))
     builder.add_node("tools", ToolNode(tools))
 
-    builder.add_edge(START, "llm_agent")
+    builder.add_edge(START, "context_manager")
+    builder.add_edge("context_manager", "llm_agent")
     builder.add_conditional_edges("llm_agent", tools_condition)
-    builder.add_edge("tools", "llm_agent")
+    builder.add_edge("tools", "context_manager")
     # builder.add_edge("llm_agent", END)
     react_graph = builder.compile(checkpointer=memory)
 
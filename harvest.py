@@ -0,0 +1,320 @@
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from pydantic import BaseModel
+
+from utils.session_pool import SessionPool
+from utils.snow_connect import SnowflakeConnection, get_session_pool
+from utils.snowddl import DDL_MANIFEST_PATH
+
+_PLAIN_IDENTIFIER = re.compile(r"^[A-Z_][A-Z0-9_$]*$")
+
+
+class Config(BaseModel):
+    database: str
+    schema_name: str
+    sql_dir: str = "sql/"
+    docs_dir: str = "docs/"
+    state_path: str = "sql/.harvest_state.json"
+    manifest_path: str = DDL_MANIFEST_PATH
+    include_views: bool = False
+    max_workers: int = 3
+
+
+@dataclass
+class ColumnMetadata:
+    name: str
+    data_type: str
+    nullable: bool
+    comment: Optional[str] = None
+    default: Optional[str] = None
+
+
+@dataclass
+class TableMetadata:
+    name: str
+    table_type: str
+    comment: Optional[str]
+    last_altered: str
+    columns: List[ColumnMetadata] = field(default_factory=list)
+    primary_key: List[str] = field(default_factory=list)
+    foreign_keys: List[Tuple[List[str], str, List[str]]] = field(default_factory=list)
+
+
+class SchemaHarvester:
+    """
+    Generates the DDL files in sql/ and the schema docs in docs/ from INFORMATION_SCHEMA.
+
+    Metadata for the whole schema is fetched with a handful of set-based queries (tables,
+    columns, primary keys, foreign keys) that run concurrently on pooled sessions. Only tables
+    whose LAST_ALTERED changed since the previous run are re-rendered, and files of dropped
+    tables are removed. The table -> DDL file mapping is written to the manifest read by
+    ``utils.snowddl.Snowddl``.
+    """
+
+    def __init__(self, config: Config, pool: SessionPool):
+        self.config = config
+        self.pool = pool
+
+    def harvest(self, force: bool = False) -> Dict[str, Any]:
+        tables = self._fetch_tables()
+        state = self._load_json(self.config.state_path)
+        manifest = self._load_json(self.config.manifest_path)
+
+        changed = sorted(
+            name
+            for name, table in tables.items()
+            if force
+            or state.get(name) != table.last_altered
+            or name not in manifest
+        )
+        removed = sorted(set(state) - set(tables))
+
+        if changed:
+            with ThreadPoolExecutor(max_workers=self.config.max_workers) as executor:
+                columns = executor.submit(self._fetch_columns, changed)
+                primary_keys = executor.submit(self._fetch_primary_keys)
+                foreign_keys = executor.submit(self._fetch_foreign_keys)
+                columns, primary_keys, foreign_keys = (
+                    columns.result(),
+                    primary_keys.result(),
+                    foreign_keys.result(),
+                )
+            for name in changed:
+                table = tables[name]
+                table.columns = columns.get(name, [])
+                table.primary_key = primary_keys.get(name, [])
+                table.foreign_keys = foreign_keys.get(name, [])
+                manifest[name] = self._write(table)
+                state[name] = table.last_altered
+
+        for name in removed:
+            for path in (manifest.pop(name, None), self._doc_path(name)):
+                if path and os.path.exists(path):
+                    os.remove(path)
+            state.pop(name, None)
+
+        self._save_json(self.config.state_path, state)
+        self._save_json(self.config.manifest_path, manifest)
+        return {
+            "tables": len(tables),
+            "refreshed": len(changed),
+            "removed": len(removed),
+            "unchanged": len(tables) - len(changed),
+        }
+
+    def _query(self, query: str, params: Optional[List[Any]] = None) -> List[Dict[str, Any]]:
+        with self.pool.session() as session:
+            return [row.as_dict() for row in session.sql(query, params=params).collect()]
+
+    def _fetch_tables(self) -> Dict[str, TableMetadata]:
+        table_types = ["BASE TABLE", "VIEW"] if self.config.include_views else ["BASE TABLE"]
+        rows = self._query(
+            f"""
+            select table_name, table_type, comment, last_altered
+            from {self._qualified("INFORMATION_SCHEMA")}.tables
+            where table_schema = ? and table_type in ({", ".join("?" * len(table_types))})
+            """,
+            [self.config.schema_name, *table_types],
+        )
+        return {
+            row["TABLE_NAME"]: TableMetadata(
+                name=row["TABLE_NAME"],
+                table_type=row["TABLE_TYPE"],
+                comment=row["COMMENT"],
+                last_altered=str(row["LAST_ALTERED"]),
+            )
+            for row in rows
+        }
+
+    def _fetch_columns(self, table_names: List[str]) -> Dict[str, List[ColumnMetadata]]:
+        columns: Dict[str, List[ColumnMetadata]] = {}
+        # Bind lists are capped, so very large schemas are fetched in slices.
+        for start in range(0, len(table_names), 1000):
+            names = table_names[start : start + 1000]
+            rows = self._query(
+                f"""
+                select table_name, column_name, data_type, character_maximum_length,
+                    numeric_precision, numeric_scale, is_nullable, column_default, comment
+                from {self._qualified("INFORMATION_SCHEMA")}.columns
+                where table_schema = ? and table_name in ({", ".join("?" * len(names))})
+                order by table_name, ordinal_position
+                """,
+                [self.config.schema_name, *names],
+            )
+            for row in rows:
+                columns.setdefault(row["TABLE_NAME"], []).append(
+                    ColumnMetadata(
+                        name=row["COLUMN_NAME"],
+                        data_type=_format_type(row),
+                        nullable=row["IS_NULLABLE"] == "YES",
+                        comment=row["COMMENT"],
+                        default=row["COLUMN_DEFAULT"],
+                    )
+                )
+        return columns
+
+    def _fetch_primary_keys(self) -> Dict[str, List[str]]:
+        rows = self._query(f"show primary keys in schema {self._qualified()}")
+        keys: Dict[str, List[Tuple[int, str]]] = {}
+        for row in rows:
+            keys.setdefault(row["table_name"], []).append(
+                (int(row["key_sequence"]), row["column_name"])
+            )
+        return {table: [name for _, name in sorted(cols)] for table, cols in keys.items()}
+
+    def _fetch_foreign_keys(self) -> Dict[str, List[Tuple[List[str], str, List[str]]]]:
+        rows = self._query(f"show imported keys in schema {self._qualified()}")
+        constraints: Dict[Tuple[str, str], List[Dict[str, Any]]] = {}
+        for row in rows:
+            constraints.setdefault((row["fk_table_name"], row["fk_name"]), []).append(row)
+        foreign_keys: Dict[str, List[Tuple[List[str], str, List[str]]]] = {}
+        for (table, _), key_rows in sorted(constraints.items()):
+            key_rows.sort(key=lambda r: int(r["key_sequence"]))
+            foreign_keys.setdefault(table, []).append(
+                (
+                    [r["fk_column_name"] for r in key_rows],
+                    key_rows[0]["pk_table_name"],
+                    [r["pk_column_name"] for r in key_rows],
+                )
+            )
+        return foreign_keys
+
+    def _write(self, table: TableMetadata) -> str:
+        ddl_path = os.path.join(self.config.sql_dir, f"ddl_{table.name.lower()}.sql")
+        _write_if_changed(ddl_path, render_ddl(table))
+        _write_if_changed(
+            self._doc_path(table.name),
+            render_doc(table, f"{self.config.database}.{self.config.schema_name}"),
+        )
+        return ddl_path
+
+    def _doc_path(self, table_name: str) -> str:
+        return os.path.join(self.config.docs_dir, f"{table_name.lower()}.md")
+
+    def _qualified(self, schema: Optional[str] = None) -> str:
+        return f"{_quote(self.config.database)}.{_quote(schema or self.config.schema_name)}"
+
+    @staticmethod
+    def _load_json(path: str) -> Dict[str, Any]:
+        if not os.path.exists(path):
+            return {}
+        with open(path, "r") as f:
+            return json.load(f)
+
+    @staticmethod
+    def _save_json(path: str, data: Dict[str, Any]) -> None:
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{path}.tmp", "w") as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(f"{path}.tmp", path)
+
+
+def _quote(identifier: str) -> str:
+    if _PLAIN_IDENTIFIER.match(identifier):
+        return identifier
+    return '"' + identifier.replace('"', '""') + '"'
+
+
+def _sql_string(value: str) -> str:
+    return "'" + value.replace("\\", "\\\\").replace("'", "\\'") + "'"
+
+
+def _format_type(row: Dict[str, Any]) -> str:
+    data_type = row["DATA_TYPE"]
+    if data_type == "TEXT":
+        length = row["CHARACTER_MAXIMUM_LENGTH"]
+        return f"VARCHAR({length})" if length else "VARCHAR"
+    if data_type == "NUMBER" and row["NUMERIC_PRECISION"] is not None:
+        return f"NUMBER({row['NUMERIC_PRECISION']},{row['NUMERIC_SCALE'] or 0})"
+    return data_type
+
+
+def render_ddl(table: TableMetadata) -> str:
+    lines = []
+    for column in table.columns:
+        line = f"{_quote(column.name)} {column.data_type}"
+        if not column.nullable:
+            line += " NOT NULL"
+        if column.default is not None:
+            line += f" DEFAULT {column.default}"
+        if column.comment:
+            line += f" COMMENT {_sql_string(column.comment)}"
+        lines.append(line)
+    if table.primary_key:
+        lines.append(f"primary key ({', '.join(map(_quote, table.primary_key))})")
+    for columns, ref_table, ref_columns in table.foreign_keys:
+        lines.append(
+            f"foreign key ({', '.join(map(_quote, columns))}) references "
+            f"{_quote(ref_table)}({', '.join(map(_quote, ref_columns))})"
+        )
+
+    kind = "VIEW" if table.table_type == "VIEW" else "TABLE"
+    body = ",\n\t".join(lines)
+    comment = f" COMMENT={_sql_string(table.comment)}" if table.comment else ""
+    return f"create or replace {kind} {_quote(table.name)} (\n\t{body}\n){comment};\n"
+
+
+def render_doc(table: TableMetadata, qualifier: str) -> str:
+    title = f"**Table: {qualifier}.{table.name}**"
+    if table.comment:
+        title += f" ({table.comment})"
+    kind = "view" if table.table_type == "VIEW" else "table"
+    lines = [title, "", f"Columns of the {table.name} {kind}:", ""]
+
+    foreign = {
+        column: f"{ref_table}.{ref_column}"
+        for columns, ref_table, ref_columns in table.foreign_keys
+        for column, ref_column in zip(columns, ref_columns)
+    }
+    for column in table.columns:
+        tags = []
+        if column.name in table.primary_key:
+            tags.append("Primary Key")
+        if column.name in foreign:
+            tags.append(f"Foreign Key to {foreign[column.name]}")
+        if not column.nullable:
+            tags.append("Not Null")
+        line = f"- {column.name}: {column.data_type}"
+        if tags:
+            line += f" [{', '.join(tags)}]"
+        if column.comment:
+            line += f" - {column.comment}"
+        lines.append(line)
+    return "\n".join(lines) + "\n"
+
+
+def _write_if_changed(path: str, content: str) -> None:
+    if os.path.exists(path):
+        with open(path, "r") as f:
+            if f.read() == content:
+                return
+    directory = os.path.dirname(path)
+    if directory:
+        os.makedirs(directory, exist_ok=True)
+    with open(path, "w") as f:
+        f.write(content)
+
+
+def run(force: bool = False):
+    connection_parameters = SnowflakeConnection._get_connection_parameters_from_env()
+    config = Config(
+        database=connection_parameters["database"].upper(),
+        schema_name=connection_parameters["schema"].upper(),
+    )
+    harvester = SchemaHarvester(config, get_session_pool())
+    result = harvester.harvest(force=force)
+    print(f"Schema harvest: {result}")
+    return result
+
+
+if __name__ == "__main__":
+    import sys
+
+    run(force="--force" in sys.argv[1:])
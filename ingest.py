@@ -1,18 +1,32 @@
-from typing import Any, Dict
+import argparse
+import json
+import os
+import uuid
+from typing import Any, Dict, Iterator, List, Optional, Tuple
 
 import streamlit as st
 from langchain.document_loaders import DirectoryLoader
 from langchain.embeddings.openai import OpenAIEmbeddings
 from langchain.text_splitter import CharacterTextSplitter
 from langchain.vectorstores import SupabaseVectorStore
+from langchain_core.documents import Document
 from pydantic import BaseModel
 
 from supabase.client import Client, create_client
+from utils.embedding_cache import CachedEmbeddings
+from utils.ingest_pipeline import IngestionPipeline
+from utils.vector_store import DEFAULT_LOCAL_INDEX_PATH, LocalVectorStore
+
+MANIFEST_VERSION = 1
+# Rows fetched per request when listing the ids stored in Supabase
+ID_PAGE_SIZE = 1000
+# Fixed namespace so the same chunk always maps to the same row id across runs.
+CHUNK_NAMESPACE = uuid.UUID("6f1f6c2e-3c0e-4d55-9a4e-2b7f1e0c9d41")
 
 
 class Secrets(BaseModel):
-    SUPABASE_URL: str
-    SUPABASE_SERVICE_KEY: str
+    SUPABASE_URL: Optional[str] = None
+    SUPABASE_SERVICE_KEY: Optional[str] = None
     OPENAI_API_KEY: str
 
 
@@ -21,39 +35,202 @@ class Config(BaseModel):
     chunk_overlap: int = 0
     docs_dir: str = "docs/"
     docs_glob: str = "**/*.md"
+    vector_backend: str = "supabase"
+    local_index_path: str = DEFAULT_LOCAL_INDEX_PATH
+    embedding_cache_path: Optional[str] = None
+    manifest_path: str = ".ingest_manifest.json"
+    embed_batch_size: int = 100
+    write_batch_size: int = 500
+    embed_workers: int = 4
+    # Ignore the manifest and reconcile with the rows actually stored
+    rebuild: bool = False
+
+
+def chunk_id(source: str, content: str) -> str:
+    """Content-addressed id of a chunk: unchanged chunks keep their id between runs."""
+    return str(uuid.uuid5(CHUNK_NAMESPACE, f"{source}\x1e{content}"))
+
+
+class IngestManifest:
+    """
+    Records which chunk ids are stored for every source file, so re-ingestion only has
+    to embed new chunks and delete the ones that disappeared.
+    """
+
+    def __init__(self, path: str, backend: str):
+        self.path = path
+        self.backend = backend
+        self.sources: Dict[str, List[str]] = {}
+        self.loaded = False
+        if os.path.exists(path):
+            with open(path, "r") as f:
+                data = json.load(f)
+            # A manifest written for another backend or format describes a different
+            # store, so start from scratch rather than trusting it.
+            if data.get("version") == MANIFEST_VERSION and data.get("backend") == backend:
+                self.sources = data.get("sources", {})
+                self.loaded = True
+
+    def chunk_ids(self) -> set:
+        return {id_ for ids in self.sources.values() for id_ in ids}
+
+    def save(self) -> None:
+        directory = os.path.dirname(self.path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        with open(f"{self.path}.tmp", "w") as f:
+            json.dump(
+                {
+                    "version": MANIFEST_VERSION,
+                    "backend": self.backend,
+                    "sources": self.sources,
+                },
+                f,
+                indent=2,
+                sort_keys=True,
+            )
+        os.replace(f"{self.path}.tmp", self.path)
 
 
 class DocumentProcessor:
     def __init__(self, secrets: Secrets, config: Config):
-        self.client: Client = create_client(
-            secrets.SUPABASE_URL, secrets.SUPABASE_SERVICE_KEY
-        )
+        self.config = config
+        self.client: Optional[Client] = None
+        if config.vector_backend != "local":
+            self.client = create_client(
+                secrets.SUPABASE_URL, secrets.SUPABASE_SERVICE_KEY
+            )
         self.loader = DirectoryLoader(config.docs_dir, glob=config.docs_glob)
         self.text_splitter = CharacterTextSplitter(
             chunk_size=config.chunk_size, chunk_overlap=config.chunk_overlap
         )
-        self.embeddings = OpenAIEmbeddings(openai_api_key=secrets.OPENAI_API_KEY)
+        self.embeddings = CachedEmbeddings(
+            OpenAIEmbeddings(openai_api_key=secrets.OPENAI_API_KEY),
+            store_path=config.embedding_cache_path,
+        )
+        if config.vector_backend == "local":
+            self.vector_store = LocalVectorStore(
+                self.embeddings, index_path=config.local_index_path
+            )
+        else:
+            self.vector_store = SupabaseVectorStore(
+                client=self.client,
+                embedding=self.embeddings,
+                table_name="documents",
+                query_name="v_match_documents",
+            )
+        self.manifest = IngestManifest(config.manifest_path, config.vector_backend)
+        self.pipeline = IngestionPipeline(
+            self.embeddings,
+            self.vector_store,
+            embed_batch_size=config.embed_batch_size,
+            write_batch_size=config.write_batch_size,
+            max_workers=config.embed_workers,
+        )
 
     def process(self) -> Dict[str, Any]:
-        data = self.loader.load()
-        texts = self.text_splitter.split_documents(data)
-        vector_store = SupabaseVectorStore.from_documents(
-            texts, self.embeddings, client=self.client
-        )
-        return vector_store
+        """
+        Incrementally syncs the vector store with the docs directory.
+
+        Chunks are identified by a hash of their source and content. Files are loaded and split
+        lazily, and only chunks that are not stored yet are streamed through the embedding
+        pipeline and upserted. Stored chunks that no longer exist in any file are deleted
+        from the store afterwards.
+        """
+        current: Dict[str, List[str]] = {}
+        stored_ids = self._stored_ids()
+        stats = self.pipeline.run(self._new_chunks(current, stored_ids))
+
+        current_ids = {id_ for ids in current.values() for id_ in ids}
+        removed_ids = sorted(stored_ids - current_ids)
+        if removed_ids:
+            self.vector_store.delete(ids=removed_ids)
+        if isinstance(self.vector_store, LocalVectorStore) and (
+            stats.written or removed_ids
+        ):
+            self.vector_store.save()
+
+        self.manifest.sources = current
+        self.manifest.save()
+        return {
+            "added": stats.written,
+            "removed": len(removed_ids),
+            "unchanged": len(current_ids) - stats.written,
+            "chunks_per_second": round(stats.throughput, 1),
+        }
 
+    def _stored_ids(self) -> set:
+        """
+        Ids of the chunks in the store. The local index is read directly, so a deleted or
+        replaced index is rebuilt even if the manifest survived. Supabase is listed when
+        there is no usable manifest (or with ``rebuild``), so rows left behind by earlier
+        full ingests with random ids are deleted on the first incremental run.
+        """
+        if isinstance(self.vector_store, LocalVectorStore):
+            ids = set(self.vector_store.ids())
+            if self.manifest.loaded and ids != self.manifest.chunk_ids():
+                print("Ingest manifest does not match the local index, ignoring it")
+            return ids
+        if self.manifest.loaded and not self.config.rebuild:
+            return self.manifest.chunk_ids()
 
-def run():
+        print("Reconciling with the rows stored in Supabase")
+        ids = set()
+        start = 0
+        while True:
+            rows = (
+                self.client.table("documents")
+                .select("id")
+                .range(start, start + ID_PAGE_SIZE - 1)
+                .execute()
+                .data
+            )
+            ids.update(str(row["id"]) for row in rows)
+            if len(rows) < ID_PAGE_SIZE:
+                return ids
+            start += ID_PAGE_SIZE
+
+    def _new_chunks(
+        self, current: Dict[str, List[str]], stored_ids: set
+    ) -> Iterator[Tuple[str, Document]]:
+        """Yields chunks missing from the store and records every chunk id in ``current``."""
+        for doc in self.loader.lazy_load():
+            for chunk in self.text_splitter.split_documents([doc]):
+                source = chunk.metadata.get("source", "")
+                id_ = chunk_id(source, chunk.page_content)
+                ids = current.setdefault(source, [])
+                if id_ in ids:
+                    continue
+                ids.append(id_)
+                if id_ not in stored_ids:
+                    yield id_, chunk
+
+
+def run(rebuild: bool = False):
     secrets = Secrets(
-        SUPABASE_URL=st.secrets["SUPABASE_URL"],
-        SUPABASE_SERVICE_KEY=st.secrets["SUPABASE_SERVICE_KEY"],
+        SUPABASE_URL=st.secrets.get("SUPABASE_URL"),
+        SUPABASE_SERVICE_KEY=st.secrets.get("SUPABASE_SERVICE_KEY"),
         OPENAI_API_KEY=st.secrets["OPENAI_API_KEY"],
     )
-    config = Config()
+    config = Config(
+        vector_backend=st.secrets.get("VECTOR_BACKEND", "supabase"),
+        local_index_path=st.secrets.get("LOCAL_VECTOR_INDEX", DEFAULT_LOCAL_INDEX_PATH),
+        embedding_cache_path=st.secrets.get("EMBEDDING_CACHE_PATH"),
+        manifest_path=st.secrets.get("INGEST_MANIFEST_PATH", ".ingest_manifest.json"),
+        rebuild=rebuild,
+    )
     doc_processor = DocumentProcessor(secrets, config)
     result = doc_processor.process()
+    print(f"Ingestion: {result}")
+    print(f"Embedding cache: {doc_processor.embeddings.stats()}")
     return result
 
 
 if __name__ == "__main__":
-    run()
+    parser = argparse.ArgumentParser(description="Sync the vector store with the docs.")
+    parser.add_argument(
+        "--rebuild",
+        action="store_true",
+        help="ignore the manifest and delete stored rows that match no current chunk",
+    )
+    run(rebuild=parser.parse_args().rebuild)
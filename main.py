@@ -1,18 +1,49 @@
 import re
+import uuid
 import warnings
 
 import streamlit as st
-from snowflake.snowpark.exceptions import SnowparkSQLException
-from langchain_core.messages import HumanMessage
-from agent import MessagesState, create_agent
+from utils.startup import print_startup_report_once, timed
+
+with timed("agent"):
+    from langchain_core.messages import AIMessage, HumanMessage
+    from agent import create_agent, reset_thread
 
-# from utils.snow_connect import SnowflakeConnection
 from utils.snowchat_ui import StreamlitUICallbackHandler, message_func
-from utils.snowddl import Snowddl
+from utils.async_runtime import iterate
+from utils.semantic_cache import SemanticCache, file_fingerprint
+from utils.snowddl import DDL_MANIFEST_PATH, Snowddl
 
 warnings.filterwarnings("ignore")
 chat_history = []
-snow_ddl = Snowddl()
+
+
+@st.cache_resource
+def get_snow_ddl():
+    return Snowddl()
+
+
+snow_ddl = get_snow_ddl()
+
+
+@st.cache_resource
+def get_semantic_cache():
+    from tools import get_embeddings
+
+    return SemanticCache(
+        get_embeddings(),
+        threshold=float(st.secrets.get("SEMANTIC_CACHE_THRESHOLD", 0.95)),
+        ttl=float(st.secrets.get("SEMANTIC_CACHE_TTL", 24 * 60 * 60)),
+        max_entries=int(st.secrets.get("SEMANTIC_CACHE_MAX_ENTRIES", 1000)),
+    )
+
+
+def answer_cache_scope(model_name):
+    """Cached answers are only reused for the same model and the same ingested schema."""
+    schema_version = file_fingerprint(
+        st.secrets.get("INGEST_MANIFEST_PATH", ".ingest_manifest.json"), DDL_MANIFEST_PATH
+    )
+    return (model_name, schema_version)
 
 gradient_text_html = """
 <style>
@@ -83,7 +114,6 @@ INITIAL_MESSAGE = [
         "content": "Hey there, I'm Chatty McQueryFace, your SQL-speaking sidekick, ready to chat up Snowflake and fetch answers faster than a snowball fight in summer! ❄️🔍",
     },
 ]
-config = {"configurable": {"thread_id": "42"}}
 
 with open("ui/sidebar.md", "r") as sidebar_file:
     sidebar_content = sidebar_file.read()
@@ -94,13 +124,17 @@ with open("ui/styles.md", "r") as styles_file:
 st.sidebar.markdown(sidebar_content)
 
 selected_table = st.sidebar.selectbox(
-    "Select a table:", options=list(snow_ddl.ddl_dict.keys())
+    "Select a table:", options=snow_ddl.table_names()
 )
 st.sidebar.markdown(f"### DDL for {selected_table} table")
-st.sidebar.code(snow_ddl.ddl_dict[selected_table], language="sql")
+st.sidebar.code(snow_ddl.get_ddl(selected_table), language="sql")
 
 # Add a reset button
 if st.sidebar.button("Reset Chat"):
+    if "thread_id" in st.session_state:
+        reset_thread(st.session_state["thread_id"])
+    if st.session_state.get("result_pager") is not None:
+        st.session_state["result_pager"].close()
     for key in st.session_state.keys():
         del st.session_state[key]
     st.session_state["messages"] = INITIAL_MESSAGE
@@ -120,6 +154,11 @@ if "messages" not in st.session_state.keys():
 if "history" not in st.session_state:
     st.session_state["history"] = []
 
+# Each browser session gets its own conversation thread in the agent's checkpointer
+if "thread_id" not in st.session_state:
+    st.session_state["thread_id"] = str(uuid.uuid4())
+config = {"configurable": {"thread_id": st.session_state["thread_id"]}}
+
 if "model" not in st.session_state:
     st.session_state["model"] = model
 
@@ -146,9 +185,28 @@ for message in messages_to_display:
         model=model,
     )
 
-callback_handler = StreamlitUICallbackHandler(model)
+callback_handler = StreamlitUICallbackHandler(
+    model,
+    render_interval=1 / float(st.secrets.get("UI_RENDER_FPS", 15)),
+    min_render_chars=int(st.secrets.get("UI_MIN_RENDER_CHARS", 1)),
+)
+
+react_graph = create_agent(st.session_state["model"])
+
 
-react_graph = create_agent(callback_handler, st.session_state["model"])
+def stream_agent(inputs, config, handler):
+    """
+    Runs the graph with the async clients on the background event loop. Events are pulled
+    into this script thread, so streamed tokens reach the UI handler in the thread that owns
+    the Streamlit context.
+    """
+    events = react_graph.astream_events(inputs, config=config, version="v2")
+    for event in iterate(events):
+        if event["event"] == "on_chat_model_stream":
+            handler.on_llm_new_token(event["data"]["chunk"].content, run_id=event["run_id"])
+        elif event["event"] == "on_chat_model_end":
+            handler.on_llm_end(event["data"]["output"], run_id=event["run_id"])
+    return react_graph.get_state(config).values
 
 
 def append_chat_history(question, answer):
@@ -162,7 +220,7 @@ def get_sql(text):
 
 def append_message(content, role="assistant"):
     """Appends a message to the session state messages."""
-    if content.strip():
+    if role == "data" or content.strip():
         st.session_state.messages.append({"role": role, "content": content})
 
 
@@ -177,21 +235,71 @@ def handle_sql_exception(query, conn, e, retries=2):
     # new_query = chain({"question": error_message, "chat_history": ""})["answer"]
     # append_message(new_query)
     # if get_sql(new_query) and retries > 0:
-    #     return execute_sql(get_sql(new_query), conn, retries - 1)
+    #     return execute_sql(get_sql(new_query), retries - 1)
     # else:
     #     append_message("I'm sorry, I couldn't fix the error. Please try again.")
     #     return None
     pass
 
 
-def execute_sql(query, conn, retries=2):
+def execute_sql(query, retries=2):
+    """
+    Starts ``query`` and returns a ResultPager over its rows, fetched in pages of
+    SQL_PAGE_SIZE rows and capped at SQL_MAX_ROWS rows / SQL_MAX_BYTES bytes. Unless
+    SQL_GUARD is off, the query is checked with the cost guard before it runs.
+    """
+    from snowflake.snowpark.exceptions import SnowparkSQLException
+    from utils.cost_guard import ALLOW
+    from utils.result_pager import ResultPager
+    from utils.snow_connect import (
+        DEFAULT_SQL_MAX_BYTES,
+        DEFAULT_SQL_MAX_ROWS,
+        get_cost_guard,
+        get_session_pool,
+        sql_guard_enabled,
+    )
+
     if re.match(r"^\s*(drop|alter|truncate|delete|insert|update)\s", query, re.I):
         append_message("Sorry, I can't execute queries that can modify the database.")
         return None
     try:
-        return conn.sql(query).collect()
+        # EXPLAIN first: expensive queries are run with a LIMIT or not at all
+        if sql_guard_enabled():
+            with get_session_pool().session() as conn:
+                decision = get_cost_guard().check(conn, query)
+            if decision.action != ALLOW:
+                append_message(decision.report())
+            if decision.rejected:
+                return None
+            query = decision.query
+        return ResultPager.from_query(
+            get_session_pool(),
+            query,
+            page_size=int(st.secrets.get("SQL_PAGE_SIZE", 500)),
+            max_rows=int(st.secrets.get("SQL_MAX_ROWS", DEFAULT_SQL_MAX_ROWS)),
+            max_bytes=int(st.secrets.get("SQL_MAX_BYTES", DEFAULT_SQL_MAX_BYTES)),
+        )
     except SnowparkSQLException as e:
-        return handle_sql_exception(query, conn, e, retries)
+        return handle_sql_exception(query, None, e, retries)
+
+
+def show_result_page(pager):
+    """Displays the next page of ``pager`` and keeps it for the "Load more rows" button."""
+    previous = st.session_state.get("result_pager")
+    if previous is not None and previous is not pager:
+        previous.close()
+    st.session_state["result_pager"] = pager
+    page = pager.next_page()
+    if page is not None:
+        callback_handler.display_dataframe(page)
+        append_message(page, "data")
+    # Shown first, then an idle tab must not keep a pooled session checked out: the rest of
+    # the result, up to the cap, is fetched now and "Load more rows" pages through memory
+    pager.detach()
+    if pager.truncated and not pager.has_more:
+        append_message(
+            f"Showing the first {pager.rows_fetched} rows, the rest of the result was not fetched."
+        )
 
 
 if (
@@ -207,24 +315,71 @@ if (
 
         messages = [HumanMessage(content=user_input_content)]
 
-        state = MessagesState(messages=messages)
-        result = react_graph.invoke(state, config=config, debug=True)
-
-        if result["messages"]:
-            assistant_message = callback_handler.final_message
-            append_message(assistant_message)
+        # Follow-up questions depend on the conversation so far, so only the first question
+        # of a thread is answered from (and stored in) the semantic cache.
+        use_answer_cache = st.secrets.get("SEMANTIC_CACHE", True) and not st.session_state.get(
+            "agent_turns"
+        )
+        cached_answer = None
+        if use_answer_cache:
+            answer_cache = get_semantic_cache()
+            scope = answer_cache_scope(st.session_state["model"])
+            cached_answer = answer_cache.lookup(user_input_content, scope)
+
+        if cached_answer is not None:
+            callback_handler.replay(cached_answer)
+            # Record the turn in the thread so follow-ups see it
+            react_graph.update_state(
+                config,
+                {"messages": messages + [AIMessage(content=cached_answer)]},
+                as_node="llm_agent",
+            )
+            append_message(cached_answer)
             st.session_state["assistant_response_processed"] = True
-
+        else:
+            # Only the new message is passed in; the summary lives in the thread's checkpoint
+            if st.secrets.get("AGENT_ASYNC", False):
+                result = stream_agent({"messages": messages}, config, callback_handler)
+            else:
+                result = react_graph.invoke(
+                    {"messages": messages},
+                    config={**config, "callbacks": [callback_handler]},
+                    debug=True,
+                )
+
+            if result["messages"]:
+                assistant_message = callback_handler.final_message
+                append_message(assistant_message)
+                st.session_state["assistant_response_processed"] = True
+                if use_answer_cache and assistant_message.strip():
+                    answer_cache.store(user_input_content, assistant_message, scope)
+        st.session_state["agent_turns"] = st.session_state.get("agent_turns", 0) + 1
+        if st.secrets.get("STARTUP_REPORT", False):
+            print_startup_report_once("first answer")
+
+        # Optionally run the SQL of the answer and show its first page below it
+        last_message = st.session_state.messages[-1]
+        if (
+            st.secrets.get("SQL_SHOW_RESULTS", False)
+            and last_message["role"] == "assistant"
+            and get_sql(last_message["content"])
+        ):
+            pager = execute_sql(get_sql(last_message["content"]))
+            if pager is not None:
+                show_result_page(pager)
+
+
+result_pager = st.session_state.get("result_pager")
+if result_pager is not None and result_pager.has_more:
+    if st.button("Load more rows"):
+        show_result_page(result_pager)
+
+
+if st.secrets.get("STARTUP_REPORT", False):
+    print_startup_report_once()
 
 if (
     st.session_state["model"] == "Mixtral 8x7B"
     and st.session_state["messages"][-1]["content"] == ""
 ):
     st.session_state["rate-limit"] = True
-
-    # if get_sql(result):
-    #     conn = SnowflakeConnection().get_session()
-    #     df = execute_sql(get_sql(result), conn)
-    #     if df is not None:
-    #         callback_handler.display_dataframe(df)
-    #         append_message(df, "data", True)
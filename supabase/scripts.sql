@@ -5,9 +5,14 @@ CREATE TABLE documents (
     metadata jsonb,
     embedding vector(1536)
 );
-CREATE INDEX ON documents USING hnsw (embedding vector_ip_ops);
-CREATE FUNCTION v_match_documents (
+-- The opclass must match the distance operator used in ORDER BY (<=> is cosine distance),
+-- otherwise the planner falls back to a sequential scan and sort of the whole table.
+CREATE INDEX ON documents USING hnsw (embedding vector_cosine_ops);
+DROP FUNCTION IF EXISTS v_match_documents (vector, jsonb);
+CREATE OR REPLACE FUNCTION v_match_documents (
     query_embedding vector (1536),
+    match_count int default 5,
+    min_similarity float default 0,
     filter jsonb default '{}'
 ) RETURNS table (
     id uuid,
@@ -16,12 +21,23 @@ CREATE FUNCTION v_match_documents (
     similarity float
 ) language plpgsql as $$ #variable_conflict use_column
 begin return query
+-- ORDER BY distance + LIMIT in the inner query lets the HNSW index drive the scan;
+-- the similarity threshold is applied to the k candidates afterwards.
 select id,
     content,
     metadata,
-    1 - (documents.embedding <=> query_embedding) as similarity
-from documents
-where metadata @> filter
-order by documents.embedding <=> query_embedding;
+    similarity
+from (
+        select id,
+            content,
+            metadata,
+            1 - (documents.embedding <=> query_embedding) as similarity
+        from documents
+        where metadata @> filter
+        order by documents.embedding <=> query_embedding
+        limit match_count
+    ) as candidates
+where similarity >= min_similarity
+order by similarity desc;
 END;
-$$;
\ No newline at end of file
+$$;
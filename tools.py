@@ -1,39 +1,151 @@
 import streamlit as st
-from supabase.client import Client, create_client
-from langchain_openai import OpenAIEmbeddings
-from langchain_community.vectorstores import SupabaseVectorStore
-from langchain.tools.retriever import create_retriever_tool
-from langchain_community.tools import DuckDuckGoSearchRun
-from utils.snow_connect import SnowflakeConnection
-
-supabase_url = st.secrets["SUPABASE_URL"]
-supabase_key = st.secrets["SUPABASE_SERVICE_KEY"]
-supabase: Client = create_client(supabase_url, supabase_key)
-
-embeddings = OpenAIEmbeddings(
-    openai_api_key=st.secrets["OPENAI_API_KEY"], model="text-embedding-ada-002"
-)
-vectorstore = SupabaseVectorStore(
-    embedding=embeddings,
-    client=supabase,
-    table_name="documents",
-    query_name="v_match_documents",
-)
+from langchain_core.callbacks import Callbacks
+from langchain_core.tools import Tool
+from langchain_core.tools.retriever import RetrieverInput
+from utils.async_runtime import run_blocking
+from utils.startup import lazy
+
+# Tools are declared eagerly so they can be bound to the LLM, but the clients behind them
+# (Supabase, OpenAI embeddings, DuckDuckGo, Snowflake) are only built on first use.
+
+
+@lazy("embeddings")
+def get_embeddings():
+    from langchain_openai import OpenAIEmbeddings
+    from utils.embedding_cache import CachedEmbeddings
+
+    return CachedEmbeddings(
+        OpenAIEmbeddings(
+            openai_api_key=st.secrets["OPENAI_API_KEY"], model="text-embedding-ada-002"
+        ),
+        store_path=st.secrets.get("EMBEDDING_CACHE_PATH"),
+    )
+
+
+def get_retriever_settings():
+    return (
+        int(st.secrets.get("SCHEMA_RETRIEVER_K", 5)),
+        float(st.secrets.get("SCHEMA_RETRIEVER_MIN_SIMILARITY", 0.7)),
+    )
+
+
+@lazy("vectorstore")
+def get_vectorstore():
+    from utils.vector_store import (
+        DEFAULT_LOCAL_INDEX_PATH,
+        LocalVectorStore,
+        SchemaVectorStore,
+    )
+
+    # "supabase" (default) or "local" for the in-process index written by ingest.py
+    vector_backend = st.secrets.get("VECTOR_BACKEND", "supabase")
+
+    if vector_backend == "local":
+        return LocalVectorStore(
+            get_embeddings(),
+            index_path=st.secrets.get("LOCAL_VECTOR_INDEX", DEFAULT_LOCAL_INDEX_PATH),
+        )
+
+    from supabase.client import Client, create_client
+
+    supabase_url = st.secrets["SUPABASE_URL"]
+    supabase_key = st.secrets["SUPABASE_SERVICE_KEY"]
+    supabase: Client = create_client(supabase_url, supabase_key)
+
+    return SchemaVectorStore(
+        embedding=get_embeddings(),
+        client=supabase,
+        table_name="documents",
+        query_name="v_match_documents",
+        min_similarity=get_retriever_settings()[1],
+    )
+
+
+@lazy("schema_retriever_tool")
+def get_schema_retriever_tool():
+    from langchain_core.tools import create_retriever_tool
+
+    retriever_k, retriever_min_similarity = get_retriever_settings()
+    return create_retriever_tool(
+        get_vectorstore().as_retriever(
+            search_type="similarity_score_threshold",
+            search_kwargs={"k": retriever_k, "score_threshold": retriever_min_similarity},
+        ),
+        name="Database_Schema",
+        description="Search for database schema details",
+    )
+
 
-retriever_tool = create_retriever_tool(
-    vectorstore.as_retriever(),
+@lazy("web_search")
+def get_web_search():
+    from langchain_community.tools import DuckDuckGoSearchRun
+
+    return DuckDuckGoSearchRun()
+
+
+def _search_schema(query: str, callbacks: Callbacks = None) -> str:
+    return get_schema_retriever_tool().func(query, callbacks=callbacks)
+
+
+async def _asearch_schema(query: str, callbacks: Callbacks = None) -> str:
+    return await get_schema_retriever_tool().coroutine(query, callbacks=callbacks)
+
+
+def _search_web(query: str, callbacks: Callbacks = None) -> str:
+    return get_web_search().run(query, callbacks=callbacks)
+
+
+async def _asearch_web(query: str, callbacks: Callbacks = None) -> str:
+    return await run_blocking(get_web_search().run, query, callbacks=callbacks)
+
+
+retriever_tool = Tool(
     name="Database_Schema",
     description="Search for database schema details",
+    func=_search_schema,
+    coroutine=_asearch_schema,
+    args_schema=RetrieverInput,
+)
+
+search = Tool(
+    name="duckduckgo_search",
+    description=(
+        "A wrapper around DuckDuckGo Search. Useful for when you need to answer questions "
+        "about current events. Input should be a search query."
+    ),
+    func=_search_web,
+    coroutine=_asearch_web,
 )
 
-search = DuckDuckGoSearchRun()
 
 def sql_executor_tool(query: str, use_cache: bool = True) -> str:
     """
-    Execute snowflake sql queries with optional caching.
+    Execute snowflake sql queries with optional caching. Queries that miss the cache are
+    checked with EXPLAIN first; the cost guard's report is returned along with the rows, and
+    so is a note when the row/byte cap cut the result short.
     """
+    from utils.snow_connect import SnowflakeConnection
+
     conn = SnowflakeConnection()
-    return conn.execute_query(query, use_cache)
+    result, meta = conn.execute_guarded(query, use_cache)
+    lines = [meta["cost_guard"]] if meta.get("cost_guard") else []
+    if result is None:
+        return "\n".join(lines)
+    if meta.get("truncated"):
+        lines.append(
+            f"Result truncated: only the first {meta['rows_fetched']} rows were fetched, so "
+            "counts, sums and other aggregates over these rows are incomplete. Aggregate "
+            "in SQL instead."
+        )
+    lines.append(str(result.to_dict("records")))
+    return "\n".join(lines)
+
+
+async def asql_executor_tool(query: str, use_cache: bool = True) -> str:
+    """
+    Async variant of sql_executor_tool.
+    """
+    return await run_blocking(sql_executor_tool, query, use_cache)
 
 # if __name__ == "__main__":
 #     print(sql_executor_tool("select * from STREAM_HACKATHON.STREAMLIT.CUSTOMER_DETAILS"))
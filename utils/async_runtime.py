@@ -0,0 +1,90 @@
+import asyncio
+import atexit
+import functools
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, AsyncIterable, Awaitable, Callable, Iterator, Optional, TypeVar
+
+T = TypeVar("T")
+
+# Upper bound on blocking client calls (Supabase, DuckDuckGo, Snowflake) in flight at once
+MAX_BLOCKING_WORKERS = 16
+
+_lock = threading.Lock()
+_loop: Optional[asyncio.AbstractEventLoop] = None
+_executor: Optional[ThreadPoolExecutor] = None
+
+
+def get_loop() -> asyncio.AbstractEventLoop:
+    """
+    Returns the process-wide event loop, running in a daemon thread.
+
+    Streamlit runs every script in its own thread without an event loop, and async clients
+    (httpx connection pools in particular) are bound to the loop they were first used on, so
+    all async work is scheduled on this one long-lived loop instead of a new ``asyncio.run``
+    per request.
+    """
+    global _loop
+    if _loop is None:
+        with _lock:
+            if _loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(
+                    target=loop.run_forever, name="snowchat-asyncio", daemon=True
+                ).start()
+                atexit.register(_shutdown)
+                _loop = loop
+    return _loop
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    if _executor is None:
+        with _lock:
+            if _executor is None:
+                _executor = ThreadPoolExecutor(
+                    max_workers=MAX_BLOCKING_WORKERS, thread_name_prefix="snowchat-blocking"
+                )
+    return _executor
+
+
+def run_coroutine(coro: Awaitable[T], timeout: Optional[float] = None) -> T:
+    """Runs ``coro`` on the background loop and blocks the calling thread until it is done."""
+    return asyncio.run_coroutine_threadsafe(coro, get_loop()).result(timeout)
+
+
+async def run_blocking(func: Callable[..., T], *args: Any, **kwargs: Any) -> T:
+    """Awaits a blocking call on the bounded executor instead of the loop's default one."""
+    return await asyncio.get_running_loop().run_in_executor(
+        get_executor(), functools.partial(func, *args, **kwargs)
+    )
+
+
+def iterate(aiterable: AsyncIterable[T]) -> Iterator[T]:
+    """
+    Consumes an async iterable from synchronous code, one item at a time, so the caller can
+    act on each item (e.g. update the UI) from its own thread while the producer runs on the
+    background loop.
+    """
+    iterator = aiterable.__aiter__()
+
+    async def next_item():
+        return await iterator.__anext__()
+
+    try:
+        while True:
+            try:
+                yield run_coroutine(next_item())
+            except StopAsyncIteration:
+                return
+    finally:
+        aclose = getattr(iterator, "aclose", None)
+        if aclose is not None:
+            run_coroutine(aclose())
+
+
+def _shutdown() -> None:
+    if _loop is not None:
+        _loop.call_soon_threadsafe(_loop.stop)
+    if _executor is not None:
+        _executor.shutdown(wait=False)
@@ -0,0 +1,365 @@
+import threading
+from collections import OrderedDict, defaultdict
+from typing import Callable, Dict, FrozenSet, Iterable, List, Optional, Sequence, Set, Tuple
+
+from utils.query_key import sql_tokens
+from utils.session_pool import SessionPool
+
+# (database, schema, table), with unquoted identifiers upper-cased as Snowflake stores them
+TableName = Tuple[str, str, str]
+
+_TABLE_KEYWORDS = {"FROM", "JOIN"}
+# Keywords that end a table reference, so they are never mistaken for its alias
+_CLAUSE_WORDS = {
+    "WHERE", "GROUP", "ORDER", "HAVING", "LIMIT", "QUALIFY", "UNION", "EXCEPT", "MINUS",
+    "INTERSECT", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL", "ON",
+    "USING", "WINDOW", "OFFSET", "FETCH", "SAMPLE", "TABLESAMPLE", "AT", "BEFORE",
+    "CHANGES", "END", "MATCH_RECOGNIZE", "PIVOT", "UNPIVOT", "START", "CONNECT", "LATERAL",
+    "ASOF", "MATCH_CONDITION", "REPEATABLE", "SEED",
+}
+# Clauses that may follow a table reference, each with an optional parenthesized argument
+_TABLE_MODIFIERS = {
+    "SAMPLE", "TABLESAMPLE", "REPEATABLE", "SEED", "AT", "BEFORE", "CHANGES", "END",
+    "MATCH_RECOGNIZE", "PIVOT", "UNPIVOT",
+}
+# Words that may sit between a modifier and its argument, e.g. SAMPLE BERNOULLI (10)
+_MODIFIER_WORDS = {"BERNOULLI", "ROW", "SYSTEM", "BLOCK"}
+# Table functions whose rows only depend on their arguments, which are scanned as usual
+_PURE_TABLE_FUNCTIONS = {"FLATTEN", "SPLIT_TO_TABLE", "STRTOK_SPLIT_TO_TABLE", "GENERATOR"}
+# Keywords that end a join condition
+_CONDITION_END = {
+    "WHERE", "GROUP", "ORDER", "HAVING", "LIMIT", "QUALIFY", "UNION", "EXCEPT", "MINUS",
+    "INTERSECT", "JOIN", "INNER", "LEFT", "RIGHT", "FULL", "CROSS", "NATURAL", "WINDOW",
+    "OFFSET", "FETCH", "SELECT",
+}
+
+
+def _identifier(kind: str, text: str) -> Optional[str]:
+    if kind == "word":
+        return text.upper()
+    if kind == "quoted_ident":
+        return text[1:-1].replace('""', '"')
+    return None
+
+
+def extract_tables(query: str, database: str, schema: str) -> FrozenSet[TableName]:
+    """
+    Returns the fully qualified tables a query reads, resolving unqualified names against
+    ``database`` and ``schema``. See ``scan_tables``.
+    """
+    return scan_tables(query, database, schema)[0]
+
+
+def scan_tables(
+    query: str, database: str, schema: str
+) -> Tuple[FrozenSet[TableName], bool]:
+    """
+    Returns the fully qualified tables a query reads and whether that set is known to be
+    complete.
+
+    This is a tokenizer-level heuristic rather than a SQL parser: names following FROM and
+    JOIN (and comma-separated FROM lists) are collected, CTE names are left out, and
+    subqueries are covered because their own FROM clauses are scanned too. Subqueries, table
+    functions, LATERAL, SAMPLE and AT/BEFORE items inside a FROM list are skipped over, and
+    so are join conditions followed by more FROM list items. A false positive only costs an
+    extra lookup of a table that does not exist, while a missed table would leave stale
+    results cached, so the set counts as incomplete when no table was found, when a FROM
+    item is not understood (e.g. a stage) or when a table function can read other data
+    (e.g. ``RESULT_SCAN``).
+    """
+    tokens = list(sql_tokens(query))
+    default = (database.upper(), schema.upper())
+
+    ctes = set()
+    for i in range(1, len(tokens) - 1):
+        # "name AS (" defines a CTE
+        if tokens[i][1].upper() == "AS" and tokens[i + 1][1] == "(":
+            name = _identifier(*tokens[i - 1])
+            if name is not None:
+                ctes.add(name)
+
+    scan = _TableScan(tokens, default, ctes)
+    for i, (kind, text) in enumerate(tokens):
+        # Every FROM/JOIN is visited, including those of subqueries skipped by the list scan
+        if kind == "word" and text.upper() in _TABLE_KEYWORDS:
+            end = scan.table_list(i + 1)
+            # "JOIN t ON <cond>, u": the FROM list goes on after the join condition
+            rest = _after_join_condition(tokens, end)
+            while rest is not None:
+                rest = _after_join_condition(tokens, scan.table_list(rest))
+    return frozenset(scan.tables), scan.complete and bool(scan.tables)
+
+
+class _TableScan:
+    def __init__(
+        self, tokens: Sequence[Tuple[str, str]], default: Tuple[str, str], ctes: Set[str]
+    ):
+        self.tokens = tokens
+        self.default = default
+        self.ctes = ctes
+        self.tables: Set[TableName] = set()
+        self.complete = True
+
+    def table_list(self, i: int) -> int:
+        """Adds the comma-separated FROM items starting at ``i``; returns their end."""
+        tokens = self.tokens
+        while True:
+            i = self._item(i)
+            if i is None:
+                return len(tokens)
+            i = self._modifiers(i)
+            # Optional alias, possibly with column names, then more modifiers
+            if i < len(tokens) and tokens[i][1].upper() == "AS":
+                i += 1
+            if i < len(tokens) and (
+                tokens[i][0] == "quoted_ident"
+                or (tokens[i][0] == "word" and tokens[i][1].upper() not in _CLAUSE_WORDS)
+            ):
+                i += 1
+                if i < len(tokens) and tokens[i][1] == "(":
+                    i = _skip_parens(tokens, i)
+            i = self._modifiers(i)
+            if i < len(tokens) and tokens[i][1] == ",":
+                i += 1
+                continue
+            return i
+
+    def _item(self, i: int) -> Optional[int]:
+        """Reads one FROM item and returns the position after it, or None at the end."""
+        tokens = self.tokens
+        if i >= len(tokens):
+            return None
+        if tokens[i][1] == "(":
+            # A subquery's FROM/JOIN keywords are visited on their own; a parenthesized
+            # join starts with a FROM item
+            if i + 1 < len(tokens) and tokens[i + 1][1].upper() not in ("SELECT", "WITH", "VALUES"):
+                self.table_list(i + 1)
+            return _skip_parens(tokens, i)
+        if tokens[i][1].upper() == "LATERAL":
+            return self._item(i + 1)
+        if tokens[i][1].upper() == "TABLE" and i + 1 < len(tokens) and tokens[i + 1][1] == "(":
+            self._item(i + 2)
+            return _skip_parens(tokens, i + 1)
+        if tokens[i][1].upper() in ("SELECT", "VALUES"):
+            return None
+
+        parts, end = _qualified_name(tokens, i)
+        if not parts or len(parts) > 3:
+            self.complete = False
+            return end
+        if end < len(tokens) and tokens[end][1] == "(":
+            if parts[-1] not in _PURE_TABLE_FUNCTIONS:
+                self.complete = False
+            return _skip_parens(tokens, end)
+        if not (len(parts) == 1 and parts[0] in self.ctes):
+            self.tables.add(self.default[: 3 - len(parts)] + tuple(parts))
+        return end
+
+    def _modifiers(self, i: int) -> int:
+        tokens = self.tokens
+        while i < len(tokens) and tokens[i][1].upper() in _TABLE_MODIFIERS:
+            i += 1
+            while i < len(tokens) and tokens[i][1].upper() in _MODIFIER_WORDS:
+                i += 1
+            if i < len(tokens) and tokens[i][1] == "(":
+                i = _skip_parens(tokens, i)
+        return i
+
+
+def _skip_parens(tokens: Sequence[Tuple[str, str]], i: int) -> int:
+    """Position after the parenthesis that closes the one at ``i``."""
+    depth = 0
+    for j in range(i, len(tokens)):
+        if tokens[j][1] == "(":
+            depth += 1
+        elif tokens[j][1] == ")":
+            depth -= 1
+            if depth == 0:
+                return j + 1
+    return len(tokens)
+
+
+def _after_join_condition(tokens: Sequence[Tuple[str, str]], i: int) -> Optional[int]:
+    """
+    If an ON/USING condition starts at ``i`` and is followed by a comma at the same depth,
+    returns the position after that comma, where the FROM list continues.
+    """
+    if i >= len(tokens) or tokens[i][1].upper() not in ("ON", "USING"):
+        return None
+    depth = 0
+    for j in range(i + 1, len(tokens)):
+        text = tokens[j][1]
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+            if depth < 0:
+                return None
+        elif depth == 0:
+            if text == ",":
+                return j + 1
+            if text == ";" or (tokens[j][0] == "word" and text.upper() in _CONDITION_END):
+                return None
+    return None
+
+
+def _qualified_name(tokens: Sequence[Tuple[str, str]], i: int) -> Tuple[List[str], int]:
+    parts: List[str] = []
+    while i < len(tokens):
+        name = _identifier(*tokens[i])
+        if name is None:
+            break
+        parts.append(name)
+        i += 1
+        if i < len(tokens) and tokens[i][1] == ".":
+            i += 1
+            continue
+        break
+    return parts, i
+
+
+def _quote_ident(name: str) -> str:
+    return '"' + name.replace('"', '""') + '"'
+
+
+def _literal(value: str) -> str:
+    return "'" + value.replace("\\", "\\\\").replace("'", "''") + "'"
+
+
+def last_altered_query(tables: Iterable[TableName]) -> str:
+    """One statement returning LAST_ALTERED of every given table, across databases."""
+    groups: Dict[Tuple[str, str], Set[str]] = defaultdict(set)
+    for database, schema, table in tables:
+        groups[(database, schema)].add(table)
+    return " union all ".join(
+        f"select table_catalog, table_schema, table_name, last_altered "
+        f"from {_quote_ident(database)}.information_schema.tables "
+        f"where table_schema = {_literal(schema)} "
+        f"and table_name in ({', '.join(_literal(t) for t in sorted(names))})"
+        for (database, schema), names in sorted(groups.items())
+    )
+
+
+class CacheInvalidator:
+    """
+    Invalidates cached query results when a table they read changes.
+
+    Every cached entry is tracked with the tables its query reads and the time it was
+    computed. A background thread polls LAST_ALTERED of all tracked tables with a single
+    batched ``information_schema`` query every ``interval`` seconds, and entries computed
+    before a change of one of their tables are handed to ``invalidate``. Entries read back
+    from a shared cache are checked with ``is_fresh`` against the last polled versions.
+
+    Parameters
+    ----------
+    pool : SessionPool
+        Pool the polling query runs on.
+    invalidate : Callable[[List[str]], None]
+        Removes the given cache keys from every cache tier.
+    interval : float
+        Seconds between two polls.
+    max_keys : int
+        Maximum number of tracked entries; the oldest are forgotten first.
+    """
+
+    def __init__(
+        self,
+        pool: SessionPool,
+        invalidate: Callable[[List[str]], None],
+        interval: float = 60.0,
+        max_keys: int = 10_000,
+    ):
+        self.pool = pool
+        self.invalidate = invalidate
+        self.interval = interval
+        self.max_keys = max_keys
+        self._entries: "OrderedDict[str, Tuple[FrozenSet[TableName], float]]" = OrderedDict()
+        self._keys_by_table: Dict[TableName, Set[str]] = defaultdict(set)
+        self._versions: Dict[TableName, float] = {}
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+        self._stats = {"polls": 0, "poll_errors": 0, "invalidated": 0}
+
+    def track(self, key: str, tables: Iterable[TableName], cached_at: float) -> None:
+        tables = frozenset(tuple(table) for table in tables)
+        with self._lock:
+            self._forget(key)
+            self._entries[key] = (tables, cached_at)
+            for table in tables:
+                self._keys_by_table[table].add(key)
+            while len(self._entries) > self.max_keys:
+                self._forget(next(iter(self._entries)))
+
+    def is_fresh(self, tables: Iterable[TableName], cached_at: float) -> bool:
+        """False if any of ``tables`` is known to have changed after ``cached_at``."""
+        with self._lock:
+            return all(
+                self._versions.get(tuple(table), 0.0) <= cached_at for table in tables
+            )
+
+    def poll(self) -> List[str]:
+        """Refreshes table versions and invalidates the entries they make stale."""
+        with self._lock:
+            tables = list(self._keys_by_table)
+        if not tables:
+            return []
+        with self.pool.session() as session:
+            rows = session.sql(last_altered_query(tables)).collect()
+
+        stale: Set[str] = set()
+        with self._lock:
+            self._stats["polls"] += 1
+            for database, schema, table, last_altered in rows:
+                if last_altered is None:
+                    continue
+                name = (database, schema, table)
+                version = last_altered.timestamp()
+                self._versions[name] = version
+                for key in self._keys_by_table.get(name, ()):
+                    if self._entries[key][1] < version:
+                        stale.add(key)
+            for key in stale:
+                self._forget(key)
+            self._stats["invalidated"] += len(stale)
+        if stale:
+            print(f"Invalidating {len(stale)} cached results after table changes")
+            self.invalidate(sorted(stale))
+        return sorted(stale)
+
+    def start(self) -> None:
+        if self._thread is None and self.interval > 0:
+            self._thread = threading.Thread(
+                target=self._run, name="snowchat-cache-invalidator", daemon=True
+            )
+            self._thread.start()
+
+    def stop(self) -> None:
+        self._stop.set()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["tracked_keys"] = len(self._entries)
+            stats["tracked_tables"] = len(self._keys_by_table)
+        return stats
+
+    def _run(self) -> None:
+        while not self._stop.wait(self.interval):
+            try:
+                self.poll()
+            except Exception as e:
+                with self._lock:
+                    self._stats["poll_errors"] += 1
+                print(f"Cache invalidation poll failed: {e}")
+
+    def _forget(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        for table in entry[0]:
+            keys = self._keys_by_table.get(table)
+            if keys is not None:
+                keys.discard(key)
+                if not keys:
+                    del self._keys_by_table[table]
@@ -0,0 +1,167 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Optional, Sequence
+
+from langchain_core.messages import HumanMessage
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.memory import MemorySaver
+
+
+def trim_messages_to_turns(messages: Sequence[Any], max_messages: int) -> list:
+    """
+    Keeps at most the last ``max_messages`` messages, cut at the start of a user turn so that
+    no tool result or assistant reply is separated from the question that led to it.
+    """
+    messages = list(messages)
+    if len(messages) <= max_messages:
+        return messages
+    tail = messages[-max_messages:]
+    for i, message in enumerate(tail):
+        if isinstance(message, HumanMessage):
+            return tail[i:]
+    # A single turn longer than the cap: keep it whole rather than orphaning tool calls.
+    last_human = max(
+        (i for i, m in enumerate(messages) if isinstance(m, HumanMessage)), default=0
+    )
+    return messages[last_human:]
+
+
+def trim_checkpoint_messages(checkpoint: dict, max_messages: int) -> dict:
+    """Returns ``checkpoint`` with its ``messages`` channel capped at ``max_messages``."""
+    messages = checkpoint.get("channel_values", {}).get("messages")
+    if not isinstance(messages, list) or len(messages) <= max_messages:
+        return checkpoint
+    return {
+        **checkpoint,
+        "channel_values": {
+            **checkpoint["channel_values"],
+            "messages": trim_messages_to_turns(messages, max_messages),
+        },
+    }
+
+
+class BoundedMemorySaver(MemorySaver):
+    """
+    In-memory checkpointer whose footprint does not grow with total traffic.
+
+    - Only the newest ``keep_checkpoints`` checkpoints of each thread are kept, together with
+      the channel blobs and pending writes they reference.
+    - The ``messages`` channel of a stored checkpoint is capped at ``max_messages``.
+    - At most ``max_threads`` threads are kept; the least recently active thread is evicted
+      first, and threads idle for longer than ``idle_ttl`` seconds are evicted as well.
+    """
+
+    def __init__(
+        self,
+        max_threads: int = 500,
+        max_messages: int = 60,
+        keep_checkpoints: int = 2,
+        idle_ttl: Optional[float] = 6 * 60 * 60,
+        **kwargs: Any,
+    ):
+        super().__init__(**kwargs)
+        self.max_threads = max_threads
+        self.max_messages = max_messages
+        self.keep_checkpoints = keep_checkpoints
+        self.idle_ttl = idle_ttl
+        self._activity: "OrderedDict[str, float]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def get_tuple(self, config: RunnableConfig):
+        with self._lock:
+            self._touch(config["configurable"]["thread_id"])
+            return super().get_tuple(config)
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        checkpoint = trim_checkpoint_messages(checkpoint, self.max_messages)
+        with self._lock:
+            thread_id = config["configurable"]["thread_id"]
+            saved = super().put(config, checkpoint, metadata, new_versions)
+            self._prune(thread_id, config["configurable"].get("checkpoint_ns", ""))
+            self._touch(thread_id)
+            self._evict()
+            return saved
+
+    def put_writes(self, config, writes, task_id, *args, **kwargs):
+        with self._lock:
+            return super().put_writes(config, writes, task_id, *args, **kwargs)
+
+    def evict_thread(self, thread_id: str) -> None:
+        with self._lock:
+            self._activity.pop(thread_id, None)
+            self.storage.pop(thread_id, None)
+            for key in [k for k in self.writes if k[0] == thread_id]:
+                del self.writes[key]
+            for key in [k for k in self.blobs if k[0] == thread_id]:
+                del self.blobs[key]
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "threads": len(self.storage),
+                "checkpoints": sum(
+                    len(checkpoints)
+                    for namespaces in self.storage.values()
+                    for checkpoints in namespaces.values()
+                ),
+                "blobs": len(self.blobs),
+            }
+
+    def _touch(self, thread_id: str) -> None:
+        self._activity[thread_id] = time.monotonic()
+        self._activity.move_to_end(thread_id)
+
+    def _evict(self) -> None:
+        now = time.monotonic()
+        while self._activity:
+            thread_id, last_active = next(iter(self._activity.items()))
+            idle = self.idle_ttl is not None and now - last_active > self.idle_ttl
+            if not idle and len(self._activity) <= self.max_threads:
+                break
+            self.evict_thread(thread_id)
+
+    def _prune(self, thread_id: str, checkpoint_ns: str) -> None:
+        checkpoints = self.storage[thread_id][checkpoint_ns]
+        if len(checkpoints) <= self.keep_checkpoints:
+            return
+        # Checkpoint ids are time-ordered, so sorting them orders checkpoints by age.
+        ordered = sorted(checkpoints)
+        stale, kept = ordered[: -self.keep_checkpoints], ordered[-self.keep_checkpoints :]
+        for checkpoint_id in stale:
+            del checkpoints[checkpoint_id]
+            self.writes.pop((thread_id, checkpoint_ns, checkpoint_id), None)
+
+        referenced = set()
+        for checkpoint_id in kept:
+            checkpoint = self.serde.loads_typed(checkpoints[checkpoint_id][0])
+            for channel, version in checkpoint["channel_versions"].items():
+                referenced.add((thread_id, checkpoint_ns, channel, version))
+        for key in [
+            k
+            for k in self.blobs
+            if k[0] == thread_id and k[1] == checkpoint_ns and k not in referenced
+        ]:
+            del self.blobs[key]
+
+
+def create_checkpointer(sqlite_path: Optional[str] = None, **kwargs: Any):
+    """
+    Returns a ``BoundedSqliteSaver`` when ``sqlite_path`` is set and the optional
+    langgraph-checkpoint-sqlite package is installed, otherwise a ``BoundedMemorySaver``.
+    Both apply the same bounds, passed as ``kwargs``.
+    """
+    if sqlite_path:
+        try:
+            import sqlite3
+
+            from utils.sqlite_checkpoint import BoundedSqliteSaver
+        except ImportError:
+            print(
+                "langgraph-checkpoint-sqlite is not installed, falling back to in-memory checkpoints"
+            )
+        else:
+            return BoundedSqliteSaver(
+                sqlite3.connect(sqlite_path, check_same_thread=False), **kwargs
+            )
+    return BoundedMemorySaver(**kwargs)
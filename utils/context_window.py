@@ -0,0 +1,174 @@
+import functools
+import json
+from typing import List, Sequence, Tuple
+
+from langchain_core.messages import (
+    AIMessage,
+    BaseMessage,
+    HumanMessage,
+    RemoveMessage,
+    ToolMessage,
+)
+
+# Rough per-message overhead of the chat format (role, separators).
+MESSAGE_OVERHEAD_TOKENS = 4
+DUPLICATE_TOOL_RESULT = "(Same result as a later {name} call, omitted to save context.)"
+SUMMARY_ITEM_CHARS = 200
+
+
+@functools.lru_cache(maxsize=1)
+def _encoding():
+    import tiktoken
+
+    try:
+        return tiktoken.get_encoding("cl100k_base")
+    except Exception as e:
+        # tiktoken downloads its BPE file on first use, which fails on offline hosts.
+        print(f"Falling back to approximate token counts: {e}")
+        return None
+
+
+@functools.lru_cache(maxsize=8192)
+def count_text_tokens(text: str) -> int:
+    encoding = _encoding()
+    if encoding is None:
+        return (len(text) + 3) // 4
+    return len(encoding.encode(text, disallowed_special=()))
+
+
+def _text(message: BaseMessage) -> str:
+    if isinstance(message.content, str):
+        return message.content
+    return "".join(
+        part if isinstance(part, str) else str(part.get("text", ""))
+        for part in message.content
+    )
+
+
+def count_tokens(message: BaseMessage) -> int:
+    tokens = MESSAGE_OVERHEAD_TOKENS + count_text_tokens(_text(message))
+    for tool_call in getattr(message, "tool_calls", None) or []:
+        tokens += count_text_tokens(tool_call["name"])
+        tokens += count_text_tokens(json.dumps(tool_call["args"], sort_keys=True))
+    return tokens
+
+
+def dedupe_tool_messages(messages: Sequence[BaseMessage]) -> List[BaseMessage]:
+    """
+    Returns replacements for tool results whose content repeats a later tool result.
+
+    The replacements keep the message id and tool_call_id, so the add_messages reducer swaps
+    them in place and every tool call still has a matching result.
+    """
+    seen = set()
+    replacements = []
+    for message in reversed(messages):
+        if not isinstance(message, ToolMessage):
+            continue
+        content = _text(message)
+        stub = DUPLICATE_TOOL_RESULT.format(name=message.name or "tool")
+        if content == stub:
+            continue
+        if content in seen:
+            replacements.append(
+                ToolMessage(
+                    content=stub,
+                    tool_call_id=message.tool_call_id,
+                    name=message.name,
+                    id=message.id,
+                )
+            )
+        else:
+            seen.add(content)
+    return replacements
+
+
+def split_turns(messages: Sequence[BaseMessage]) -> List[List[BaseMessage]]:
+    """Groups messages into turns, each starting at a user message."""
+    turns: List[List[BaseMessage]] = []
+    for message in messages:
+        if isinstance(message, HumanMessage) or not turns:
+            turns.append([])
+        turns[-1].append(message)
+    return turns
+
+
+def fit_to_budget(
+    messages: Sequence[BaseMessage], budget: int
+) -> Tuple[List[BaseMessage], List[BaseMessage]]:
+    """
+    Keeps the newest whole turns whose combined size fits in ``budget`` tokens and returns
+    ``(kept, dropped)``. The latest turn is always kept, even when it alone exceeds the budget.
+    """
+    turns = split_turns(messages)
+    kept_turns: List[List[BaseMessage]] = []
+    used = 0
+    for turn in reversed(turns):
+        size = sum(count_tokens(message) for message in turn)
+        if kept_turns and used + size > budget:
+            break
+        kept_turns.append(turn)
+        used += size
+    dropped_turns = turns[: len(turns) - len(kept_turns)]
+    kept = [message for turn in reversed(kept_turns) for message in turn]
+    dropped = [message for turn in dropped_turns for message in turn]
+    return kept, dropped
+
+
+def summarize_turns(messages: Sequence[BaseMessage]) -> str:
+    """Extractive summary of dropped turns: each question with the start of its final answer."""
+    lines = []
+    for turn in split_turns(messages):
+        question = next((m for m in turn if isinstance(m, HumanMessage)), None)
+        answer = next(
+            (
+                m
+                for m in reversed(turn)
+                if isinstance(m, AIMessage) and not m.tool_calls and _text(m).strip()
+            ),
+            None,
+        )
+        if question is None:
+            continue
+        line = f"- User asked: {_shorten(_text(question))}"
+        if answer is not None:
+            line += f" | Assistant answered: {_shorten(_text(answer))}"
+        lines.append(line)
+    return "\n".join(lines)
+
+
+def manage_context(
+    messages: Sequence[BaseMessage], summary: str, budget: int, summary_budget: int
+) -> Tuple[List[BaseMessage], str]:
+    """
+    Computes the state update that keeps the conversation within ``budget`` tokens.
+
+    Returns the message updates (deduplicated tool results and removals of dropped turns)
+    and the new running summary of everything that was dropped, trimmed to its newest
+    ``summary_budget`` tokens.
+    """
+    replacements = dedupe_tool_messages(messages)
+    replaced = {message.id: message for message in replacements}
+    current = [replaced.get(message.id, message) for message in messages]
+
+    _, dropped = fit_to_budget(current, budget)
+    if not dropped:
+        return replacements, summary
+
+    dropped_ids = {message.id for message in dropped if message.id}
+    updates: List[BaseMessage] = [
+        message for message in replacements if message.id not in dropped_ids
+    ]
+    updates.extend(RemoveMessage(id=message_id) for message_id in dropped_ids)
+
+    lines = [line for line in (summary + "\n" + summarize_turns(dropped)).splitlines() if line]
+    while len(lines) > 1 and count_text_tokens("\n".join(lines)) > summary_budget:
+        lines.pop(0)
+    return updates, "\n".join(lines)
+
+
+def _shorten(text: str) -> str:
+    text = " ".join(text.split())
+    if len(text) <= SUMMARY_ITEM_CHARS:
+        return text
+    return text[: SUMMARY_ITEM_CHARS - 3] + "..."
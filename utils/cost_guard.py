@@ -0,0 +1,263 @@
+import json
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+from snowflake.snowpark.exceptions import SnowparkSQLException
+from snowflake.snowpark.session import Session
+
+from utils.query_key import sql_token_spans, sql_tokens
+
+ALLOW = "allow"
+LIMIT = "limit"
+REJECT = "reject"
+
+# Statements EXPLAIN can estimate; anything else (SHOW, DESCRIBE, ...) runs unchecked
+_EXPLAINABLE = {"SELECT", "WITH"}
+
+
+@dataclass(frozen=True)
+class CostBudget:
+    """
+    Limits for a single query, estimated with EXPLAIN before it runs.
+
+    Queries above ``max_scan_bytes`` or ``max_partitions`` only run wrapped in a LIMIT of
+    ``limit_rows``, and only if the LIMIT brings the estimate within budget; queries above
+    ``reject_scan_bytes`` (or plans with a cartesian join that are also over budget) do not
+    run at all. ``statement_timeout`` is the per-statement
+    timeout set on the pooled sessions and is only reported here.
+    """
+
+    max_scan_bytes: int = 10 * 1024**3
+    reject_scan_bytes: int = 100 * 1024**3
+    max_partitions: int = 10_000
+    limit_rows: int = 10_000
+    statement_timeout: int = 120
+
+
+@dataclass
+class CostEstimate:
+    partitions_total: int = 0
+    partitions_assigned: int = 0
+    bytes_assigned: int = 0
+    operations: List[str] = field(default_factory=list)
+
+    @classmethod
+    def from_explain(cls, plan: Dict[str, Any]) -> "CostEstimate":
+        stats = plan.get("GlobalStats", {})
+        operations = [
+            step.get("operation", "")
+            for steps in plan.get("Operations", [])
+            for step in steps
+        ]
+        return cls(
+            partitions_total=int(stats.get("partitionsTotal", 0)),
+            partitions_assigned=int(stats.get("partitionsAssigned", 0)),
+            bytes_assigned=int(stats.get("bytesAssigned", 0)),
+            operations=operations,
+        )
+
+    @property
+    def has_cartesian_join(self) -> bool:
+        return "CartesianJoin" in self.operations
+
+    def describe(self) -> str:
+        return (
+            f"{self.partitions_assigned} of {self.partitions_total} partitions, "
+            f"{_format_bytes(self.bytes_assigned)}"
+        )
+
+
+@dataclass
+class GuardDecision:
+    action: str
+    query: str
+    # None when the statement could not be estimated
+    estimate: Optional[CostEstimate]
+    reasons: List[str] = field(default_factory=list)
+    statement_timeout: Optional[int] = None
+    # Estimate of the query rewritten with a LIMIT, when that was tried
+    limited_estimate: Optional[CostEstimate] = None
+
+    @property
+    def rejected(self) -> bool:
+        return self.action == REJECT
+
+    def report(self) -> str:
+        """Summary of the decision and the estimates behind it, meant for the agent."""
+        if self.estimate is None:
+            lines = [f"Cost guard: {self.action}. No estimate."]
+        else:
+            lines = [f"Cost guard: {self.action}. Estimated scan: {self.estimate.describe()}."]
+        lines.extend(f"- {reason}" for reason in self.reasons)
+        if self.action == LIMIT:
+            lines.append(
+                f"The query was run as: {self.query}\n"
+                f"Estimated scan with the LIMIT: {self.limited_estimate.describe()}."
+            )
+        elif self.rejected:
+            lines.append(
+                "The query was not run. Add selective filters, ideally on clustering "
+                "columns, or read fewer columns or tables."
+            )
+        if self.statement_timeout:
+            lines.append(f"Statements time out after {self.statement_timeout} seconds.")
+        return "\n".join(lines)
+
+
+class CostGuard:
+    """Runs EXPLAIN for a query and decides whether it may run, and in which form."""
+
+    def __init__(self, budget: CostBudget):
+        self.budget = budget
+
+    def explain(self, session: Session, query: str) -> CostEstimate:
+        rows = session.sql(f"EXPLAIN USING JSON {strip_semicolons(query)}").collect()
+        return CostEstimate.from_explain(json.loads(rows[0][0]))
+
+    def check(self, session: Session, query: str) -> GuardDecision:
+        budget = self.budget
+        statement_timeout = budget.statement_timeout or None
+        if first_keyword(query) not in _EXPLAINABLE:
+            return GuardDecision(
+                ALLOW, query, None, ["Not a SELECT statement, so it was not checked."],
+                statement_timeout,
+            )
+        try:
+            estimate = self.explain(session, query)
+        except SnowparkSQLException as e:
+            return GuardDecision(
+                ALLOW, query, None, [f"EXPLAIN failed, so it was not checked: {e}"],
+                statement_timeout,
+            )
+
+        reasons = self.over_budget(estimate)
+        decision = GuardDecision(ALLOW, query, estimate, reasons, statement_timeout)
+        if estimate.bytes_assigned > budget.reject_scan_bytes:
+            decision.action = REJECT
+            reasons.append(
+                f"Scans more than the {_format_bytes(budget.reject_scan_bytes)} hard limit."
+            )
+        elif reasons and estimate.has_cartesian_join:
+            decision.action = REJECT
+            reasons.append("The plan contains a cartesian join.")
+        elif reasons:
+            # A LIMIT does not shrink the scan of aggregates, GROUP BY or ORDER BY, so the
+            # rewritten query must be within budget itself
+            limited = inject_limit(query, budget.limit_rows)
+            limited_estimate = estimate
+            if limited != query:
+                try:
+                    limited_estimate = self.explain(session, limited)
+                except SnowparkSQLException as e:
+                    print(f"EXPLAIN of the limited query failed: {e}")
+            if self.over_budget(limited_estimate):
+                decision.action = REJECT
+                reasons.append(
+                    f"Still over budget with a LIMIT of {budget.limit_rows} rows; "
+                    "aggregates, GROUP BY and ORDER BY read their whole input."
+                )
+            else:
+                decision.action = LIMIT
+                decision.query = limited
+                decision.limited_estimate = limited_estimate
+        elif estimate.has_cartesian_join:
+            reasons.append("The plan contains a cartesian join (within budget).")
+        return decision
+
+    def over_budget(self, estimate: CostEstimate) -> List[str]:
+        """Reasons why ``estimate`` exceeds the soft budget; empty if it does not."""
+        reasons = []
+        if estimate.bytes_assigned > self.budget.max_scan_bytes:
+            reasons.append(
+                f"Scans more than the {_format_bytes(self.budget.max_scan_bytes)} budget."
+            )
+        if estimate.partitions_assigned > self.budget.max_partitions:
+            reasons.append(
+                f"Scans more than the {self.budget.max_partitions} partition budget."
+            )
+        return reasons
+
+
+def strip_semicolons(query: str) -> str:
+    query = query.strip()
+    while query.endswith(";"):
+        query = query[:-1].rstrip()
+    return query
+
+
+def first_keyword(query: str) -> Optional[str]:
+    """First keyword of ``query``, upper-cased, skipping comments and opening parentheses."""
+    for kind, text in sql_tokens(query):
+        if text != "(":
+            return text.upper() if kind == "word" else None
+    return None
+
+
+def top_level_limit(query: str) -> Optional[int]:
+    """Row count of the outermost LIMIT/FETCH clause of ``query``, or None if it has none."""
+    return _top_level_clauses(query).limit
+
+
+@dataclass
+class _TopLevelClauses:
+    limit: Optional[int] = None
+    # Offsets of the LIMIT/FETCH row count in the query
+    limit_span: Optional[Tuple[int, int]] = None
+    ordered: bool = False
+    offset_start: Optional[int] = None
+
+
+def _top_level_clauses(query: str) -> _TopLevelClauses:
+    clauses = _TopLevelClauses()
+    depth = 0
+    tokens = list(sql_token_spans(query))
+    for i, (kind, text, start) in enumerate(tokens):
+        if text == "(":
+            depth += 1
+        elif text == ")":
+            depth -= 1
+        elif depth != 0 or kind != "word":
+            continue
+        elif text.upper() == "ORDER" and i + 1 < len(tokens) and tokens[i + 1][1].upper() == "BY":
+            clauses.ordered = True
+        elif text.upper() == "OFFSET":
+            clauses.offset_start = start
+        elif text.upper() in ("LIMIT", "FETCH", "TOP"):
+            # The tokenizer yields digits one at a time; skip FIRST/NEXT and join the digits
+            j = i + 1
+            while j < len(tokens) and j <= i + 2 and not tokens[j][1].isdigit():
+                j += 1
+            first = j
+            while j < len(tokens) and tokens[j][1].isdigit():
+                j += 1
+            if j > first:
+                clauses.limit = int("".join(token[1] for token in tokens[first:j]))
+                clauses.limit_span = (tokens[first][2], tokens[j - 1][2] + 1)
+    return clauses
+
+
+def inject_limit(query: str, max_rows: int) -> str:
+    """Rewrites ``query`` so it returns at most ``max_rows`` rows, unless it already does."""
+    clauses = _top_level_clauses(query)
+    if clauses.limit is not None and clauses.limit <= max_rows:
+        return query
+    if clauses.ordered:
+        # Snowflake does not carry an ORDER BY out of a subquery, so wrapping an ordered
+        # query could keep the wrong rows; the limit goes to the top level instead
+        if clauses.limit_span is not None:
+            start, end = clauses.limit_span
+            return f"{query[:start]}{max_rows}{query[end:]}"
+        if clauses.offset_start is not None:
+            start = clauses.offset_start
+            return f"{query[:start]}limit {max_rows} {query[start:]}"
+        return f"{strip_semicolons(query)}\nlimit {max_rows}"
+    # Newlines keep a trailing line comment from swallowing the closing parenthesis
+    return f"select * from (\n{strip_semicolons(query)}\n) limit {max_rows}"
+
+
+def _format_bytes(nbytes: int) -> str:
+    size = float(nbytes)
+    for unit in ("B", "KB", "MB", "GB", "TB"):
+        if size < 1024 or unit == "TB":
+            return f"{size:.0f} {unit}" if unit == "B" else f"{size:.1f} {unit}"
+        size /= 1024
@@ -0,0 +1,152 @@
+import hashlib
+import os
+import sqlite3
+import threading
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+from utils.result_cache import LRUCache
+
+DEFAULT_EMBEDDING_CACHE_MAX_BYTES = 32 * 1024 * 1024
+
+
+class EmbeddingStore:
+    """
+    SQLite-backed store of float32 embedding vectors keyed by content hash.
+    Safe to share between threads.
+    """
+
+    def __init__(self, path: str):
+        directory = os.path.dirname(path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        self.path = path
+        self._lock = threading.Lock()
+        self._conn = sqlite3.connect(path, check_same_thread=False)
+        with self._lock, self._conn:
+            self._conn.execute(
+                "CREATE TABLE IF NOT EXISTS embeddings (key TEXT PRIMARY KEY, vector BLOB NOT NULL)"
+            )
+
+    def get_many(self, keys: Sequence[str]) -> Dict[str, bytes]:
+        found: Dict[str, bytes] = {}
+        # Stay well below SQLite's limit on the number of bound parameters.
+        for start in range(0, len(keys), 500):
+            batch = list(keys[start : start + 500])
+            placeholders = ",".join("?" * len(batch))
+            with self._lock:
+                rows = self._conn.execute(
+                    f"SELECT key, vector FROM embeddings WHERE key IN ({placeholders})",
+                    batch,
+                ).fetchall()
+            found.update(rows)
+        return found
+
+    def put_many(self, items: Dict[str, bytes]) -> None:
+        with self._lock, self._conn:
+            self._conn.executemany(
+                "INSERT OR REPLACE INTO embeddings (key, vector) VALUES (?, ?)",
+                list(items.items()),
+            )
+
+    def close(self) -> None:
+        with self._lock:
+            self._conn.close()
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an ``Embeddings`` object with a content-hashed cache.
+
+    Vectors are looked up in an in-memory LRU first, then in an optional SQLite store, and
+    only the remaining texts are sent to the underlying model in a single batch. Keys include
+    the model name so vectors from different models never mix.
+
+    Attributes
+    ----------
+    underlying : Embeddings
+        The embeddings model that computes vectors on a cache miss.
+    memory : LRUCache
+        In-memory tier holding float32 vector bytes.
+    store : EmbeddingStore, optional
+        On-disk tier, enabled when ``store_path`` is given.
+    """
+
+    def __init__(
+        self,
+        underlying: Embeddings,
+        store_path: Optional[str] = None,
+        max_bytes: int = DEFAULT_EMBEDDING_CACHE_MAX_BYTES,
+        namespace: Optional[str] = None,
+    ):
+        self.underlying = underlying
+        self.namespace = namespace or getattr(underlying, "model", "") or ""
+        self.memory = LRUCache(max_bytes=max_bytes)
+        self.store = EmbeddingStore(store_path) if store_path else None
+        self._stats_lock = threading.Lock()
+        self._disk_hits = 0
+        self._computed = 0
+
+    def embed_query(self, text: str) -> List[float]:
+        return self._embed([text], self.underlying.embed_query)[0]
+
+    def embed_documents(self, texts: List[str]) -> List[List[float]]:
+        return self._embed(texts, None)
+
+    def stats(self) -> Dict[str, Any]:
+        memory = self.memory.stats.as_dict()
+        with self._stats_lock:
+            disk_hits, computed = self._disk_hits, self._computed
+        lookups = memory["hits"] + memory["misses"]
+        return {
+            "memory_hits": memory["hits"],
+            "disk_hits": disk_hits,
+            "misses": computed,
+            "hit_rate": (lookups - computed) / lookups if lookups else 0.0,
+            "memory_entries": len(self.memory),
+            "memory_bytes": self.memory.current_bytes,
+        }
+
+    def _key(self, text: str) -> str:
+        return hashlib.sha256(f"{self.namespace}\x1e{text}".encode("utf-8")).hexdigest()
+
+    def _embed(self, texts: List[str], embed_one) -> List[List[float]]:
+        keys = [self._key(text) for text in texts]
+        vectors: Dict[str, bytes] = {}
+        for key in set(keys):
+            cached = self.memory.get(key)
+            if cached is not None:
+                vectors[key] = cached
+
+        pending = [key for key in dict.fromkeys(keys) if key not in vectors]
+        if pending and self.store is not None:
+            from_disk = self.store.get_many(pending)
+            for key, vector in from_disk.items():
+                self.memory.set(key, vector)
+            vectors.update(from_disk)
+            with self._stats_lock:
+                self._disk_hits += len(from_disk)
+            pending = [key for key in pending if key not in vectors]
+
+        if pending:
+            texts_by_key = dict(zip(keys, texts))
+            pending_texts = [texts_by_key[key] for key in pending]
+            if embed_one is not None and len(pending_texts) == 1:
+                computed = [embed_one(pending_texts[0])]
+            else:
+                computed = self.underlying.embed_documents(pending_texts)
+            new_vectors = {
+                key: np.asarray(vector, dtype=np.float32).tobytes()
+                for key, vector in zip(pending, computed)
+            }
+            for key, vector in new_vectors.items():
+                self.memory.set(key, vector)
+            if self.store is not None:
+                self.store.put_many(new_vectors)
+            vectors.update(new_vectors)
+            with self._stats_lock:
+                self._computed += len(new_vectors)
+
+        return [np.frombuffer(vectors[key], dtype=np.float32).tolist() for key in keys]
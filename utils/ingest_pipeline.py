@@ -0,0 +1,169 @@
+import itertools
+import random
+import threading
+import time
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from dataclasses import dataclass, field
+from typing import Iterable, Iterator, List, Optional, Set, Tuple
+
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+
+Chunk = Tuple[str, Document]
+
+
+@dataclass
+class PipelineStats:
+    chunks: int = 0
+    embedded: int = 0
+    written: int = 0
+    embed_batches: int = 0
+    write_batches: int = 0
+    retries: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def throughput(self) -> float:
+        """Chunks written per second."""
+        return self.written / self.elapsed if self.elapsed > 0 else 0.0
+
+    def summary(self) -> str:
+        return (
+            f"{self.written}/{self.chunks} chunks written, {self.embedded} embedded in "
+            f"{self.embed_batches} batches, {self.retries} retries, "
+            f"{self.elapsed:.1f}s ({self.throughput:.1f} chunks/s)"
+        )
+
+
+class IngestionPipeline:
+    """
+    Streams chunks through concurrent embedding into bulk vector store writes.
+
+    Chunks are pulled lazily from the input iterable and grouped into batches of
+    ``embed_batch_size``. At most ``max_workers`` batches are embedded at a time, with a
+    bounded number queued behind them, so memory stays flat no matter how many chunks the
+    source yields. Rate-limited batches are retried with exponential backoff (honouring a
+    Retry-After header when the provider sends one). Embedded chunks are buffered and written
+    with ``add_vectors`` in batches of ``write_batch_size`` from the calling thread.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        vector_store: VectorStore,
+        embed_batch_size: int = 100,
+        write_batch_size: int = 500,
+        max_workers: int = 4,
+        max_retries: int = 6,
+        backoff_base: float = 1.0,
+        backoff_max: float = 60.0,
+        progress_interval: float = 5.0,
+    ):
+        self.embeddings = embeddings
+        self.vector_store = vector_store
+        self.embed_batch_size = embed_batch_size
+        self.write_batch_size = write_batch_size
+        self.max_workers = max_workers
+        self.max_retries = max_retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.progress_interval = progress_interval
+        self.stats = PipelineStats()
+        self._last_progress = 0.0
+        self._retry_lock = threading.Lock()
+
+    def run(self, chunks: Iterable[Chunk]) -> PipelineStats:
+        self.stats = PipelineStats()
+        self._last_progress = time.monotonic()
+        buffer: List[Tuple[str, Document, List[float]]] = []
+        pending: Set[Future] = set()
+        max_pending = self.max_workers * 2
+
+        with ThreadPoolExecutor(
+            max_workers=self.max_workers, thread_name_prefix="embed"
+        ) as executor:
+            for batch in self._batches(chunks):
+                if len(pending) >= max_pending:
+                    done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                    self._collect(done, buffer)
+                pending.add(executor.submit(self._embed_batch, batch))
+            while pending:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                self._collect(done, buffer)
+
+        self._flush(buffer)
+        print(f"Ingestion pipeline finished: {self.stats.summary()}")
+        return self.stats
+
+    def _batches(self, chunks: Iterable[Chunk]) -> Iterator[List[Chunk]]:
+        iterator = iter(chunks)
+        while batch := list(itertools.islice(iterator, self.embed_batch_size)):
+            self.stats.chunks += len(batch)
+            yield batch
+
+    def _collect(self, done: Set[Future], buffer: list) -> None:
+        for future in done:
+            batch, vectors = future.result()
+            self.stats.embedded += len(batch)
+            self.stats.embed_batches += 1
+            buffer.extend(
+                (id_, doc, vector) for (id_, doc), vector in zip(batch, vectors)
+            )
+        if len(buffer) >= self.write_batch_size:
+            self._flush(buffer)
+        self._report_progress()
+
+    def _flush(self, buffer: list) -> None:
+        while buffer:
+            batch = buffer[: self.write_batch_size]
+            del buffer[: self.write_batch_size]
+            self.vector_store.add_vectors(
+                [vector for _, _, vector in batch],
+                [doc for _, doc, _ in batch],
+                ids=[id_ for id_, _, _ in batch],
+            )
+            self.stats.written += len(batch)
+            self.stats.write_batches += 1
+
+    def _embed_batch(self, batch: List[Chunk]) -> Tuple[List[Chunk], List[List[float]]]:
+        texts = [doc.page_content for _, doc in batch]
+        for attempt in itertools.count():
+            try:
+                return batch, self.embeddings.embed_documents(texts)
+            except Exception as e:
+                if not self._is_rate_limit(e) or attempt >= self.max_retries:
+                    raise
+                delay = self._retry_after(e)
+                if delay is None:
+                    delay = self.backoff_base * 2**attempt * random.uniform(0.5, 1.0)
+                delay = min(self.backoff_max, delay)
+                with self._retry_lock:
+                    self.stats.retries += 1
+                print(f"Embedding rate limited, retrying in {delay:.1f}s: {e}")
+                time.sleep(delay)
+
+    def _report_progress(self) -> None:
+        now = time.monotonic()
+        if now - self._last_progress >= self.progress_interval:
+            self._last_progress = now
+            print(f"Ingestion progress: {self.stats.summary()}")
+
+    @staticmethod
+    def _is_rate_limit(error: Exception) -> bool:
+        status = getattr(error, "status_code", None) or getattr(
+            getattr(error, "response", None), "status_code", None
+        )
+        return status == 429 or type(error).__name__ == "RateLimitError"
+
+    @staticmethod
+    def _retry_after(error: Exception) -> Optional[float]:
+        headers = getattr(getattr(error, "response", None), "headers", None) or {}
+        try:
+            return float(headers.get("retry-after"))
+        except (TypeError, ValueError):
+            return None
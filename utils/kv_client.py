@@ -0,0 +1,224 @@
+import base64
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Dict, Iterable, Mapping, Optional
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from utils.async_runtime import run_blocking
+
+KV_API_URL = "https://api.cloudflare.com/client/v4/accounts/{account_id}/storage/kv/namespaces/{namespace_id}"
+# Cloudflare accepts at most this many keys per bulk write or delete request
+BULK_BATCH_SIZE = 10_000
+
+
+class CircuitBreaker:
+    """
+    Stops calls to a failing dependency for a while.
+
+    After ``failure_threshold`` consecutive failures the circuit opens and ``allow`` returns
+    False for ``reset_timeout`` seconds. Then a single trial call is let through (half-open):
+    success closes the circuit, failure opens it again.
+    """
+
+    def __init__(self, failure_threshold: int = 5, reset_timeout: float = 30.0):
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._failures = 0
+        self._opened_at: Optional[float] = None
+        self._trial_in_flight = False
+        self._lock = threading.Lock()
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._opened_at is None:
+                return "closed"
+            if time.monotonic() - self._opened_at >= self.reset_timeout:
+                return "half-open"
+            return "open"
+
+    def allow(self) -> bool:
+        with self._lock:
+            if self._opened_at is None:
+                return True
+            if time.monotonic() - self._opened_at < self.reset_timeout or self._trial_in_flight:
+                return False
+            self._trial_in_flight = True
+            return True
+
+    def record_success(self) -> None:
+        with self._lock:
+            self._failures = 0
+            self._opened_at = None
+            self._trial_in_flight = False
+
+    def record_failure(self) -> None:
+        with self._lock:
+            self._failures += 1
+            self._trial_in_flight = False
+            if self._opened_at is not None or self._failures >= self.failure_threshold:
+                self._opened_at = time.monotonic()
+
+
+class KVClient:
+    """
+    Cloudflare Workers KV client used as the shared result cache.
+
+    Requests go through one pooled keep-alive ``requests.Session`` with strict connect/read
+    timeouts. Every failure counts towards a circuit breaker; while it is open, reads return
+    None and writes return False immediately, so a slow or dead KV degrades to a cache miss
+    instead of a hung query.
+
+    Attributes
+    ----------
+    timeout : tuple
+        ``(connect_timeout, read_timeout)`` in seconds for every request.
+    breaker : CircuitBreaker
+        Breaker shared by all calls of this client.
+    """
+
+    def __init__(
+        self,
+        account_id: str,
+        namespace_id: str,
+        api_token: str,
+        connect_timeout: float = 2.0,
+        read_timeout: float = 5.0,
+        pool_size: int = 16,
+        failure_threshold: int = 5,
+        reset_timeout: float = 30.0,
+    ):
+        self.base_url = KV_API_URL.format(account_id=account_id, namespace_id=namespace_id)
+        self.timeout = (connect_timeout, read_timeout)
+        self.breaker = CircuitBreaker(failure_threshold, reset_timeout)
+        self.session = requests.Session()
+        self.session.headers["Authorization"] = f"Bearer {api_token}"
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_size, max_retries=0)
+        self.session.mount("https://", adapter)
+        self._executor = ThreadPoolExecutor(
+            max_workers=pool_size, thread_name_prefix="snowchat-kv"
+        )
+        self._stats = {"requests": 0, "failures": 0, "short_circuited": 0}
+        self._stats_lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[bytes]:
+        """Returns the value of ``key``, or None on a miss, an error or an open circuit."""
+        response = self._request("GET", f"/values/{key}", allow_status=(404,))
+        if response is None or response.status_code == 404:
+            return None
+        return response.content
+
+    def put(self, key: str, value: bytes, expiration_ttl: Optional[int] = None) -> bool:
+        params = {"expiration_ttl": expiration_ttl} if expiration_ttl else None
+        response = self._request(
+            "PUT",
+            f"/values/{key}",
+            data=value,
+            params=params,
+            headers={"Content-Type": "application/octet-stream"},
+        )
+        return response is not None
+
+    def delete(self, key: str) -> bool:
+        return self._request("DELETE", f"/values/{key}", allow_status=(404,)) is not None
+
+    def bulk_get(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        """
+        Fetches many keys concurrently over the pooled connections and returns the ones that
+        exist. (KV's bulk read endpoint only returns text values, so binary results are read
+        one key per request.)
+        """
+        keys = list(dict.fromkeys(keys))
+        values = self._executor.map(self.get, keys)
+        return {key: value for key, value in zip(keys, values) if value is not None}
+
+    def bulk_put(self, items: Mapping[str, bytes], expiration_ttl: Optional[int] = None) -> bool:
+        """Writes many values with the bulk endpoint, up to ``BULK_BATCH_SIZE`` per request."""
+        entries = []
+        for key, value in items.items():
+            entry = {"key": key, "value": base64.b64encode(value).decode("ascii"), "base64": True}
+            if expiration_ttl:
+                entry["expiration_ttl"] = expiration_ttl
+            entries.append(entry)
+        # Every batch is sent even if an earlier one failed
+        results = [
+            self._request("PUT", "/bulk", json=entries[i : i + BULK_BATCH_SIZE]) is not None
+            for i in range(0, len(entries), BULK_BATCH_SIZE)
+        ]
+        return all(results)
+
+    def bulk_delete(self, keys: Iterable[str]) -> bool:
+        keys = list(keys)
+        results = [
+            self._request("POST", "/bulk/delete", json=keys[i : i + BULK_BATCH_SIZE]) is not None
+            for i in range(0, len(keys), BULK_BATCH_SIZE)
+        ]
+        return all(results)
+
+    async def aget(self, key: str) -> Optional[bytes]:
+        return await run_blocking(self.get, key)
+
+    async def aput(self, key: str, value: bytes, expiration_ttl: Optional[int] = None) -> bool:
+        return await run_blocking(self.put, key, value, expiration_ttl)
+
+    async def adelete(self, key: str) -> bool:
+        return await run_blocking(self.delete, key)
+
+    async def abulk_get(self, keys: Iterable[str]) -> Dict[str, bytes]:
+        return await run_blocking(self.bulk_get, keys)
+
+    async def abulk_put(
+        self, items: Mapping[str, bytes], expiration_ttl: Optional[int] = None
+    ) -> bool:
+        return await run_blocking(self.bulk_put, items, expiration_ttl)
+
+    async def abulk_delete(self, keys: Iterable[str]) -> bool:
+        return await run_blocking(self.bulk_delete, keys)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._stats_lock:
+            stats = dict(self._stats)
+        stats["circuit"] = self.breaker.state
+        return stats
+
+    def close(self) -> None:
+        self._executor.shutdown(wait=False)
+        self.session.close()
+
+    def _request(
+        self, method: str, path: str, allow_status: tuple = (), **kwargs: Any
+    ) -> Optional[requests.Response]:
+        """
+        Sends one request. Returns None when the circuit is open or the request failed;
+        statuses in ``allow_status`` are returned without counting as failures.
+        """
+        if not self.breaker.allow():
+            self._count("short_circuited")
+            return None
+        self._count("requests")
+        try:
+            response = self.session.request(
+                method, self.base_url + path, timeout=self.timeout, **kwargs
+            )
+            if response.status_code not in allow_status:
+                response.raise_for_status()
+        except requests.exceptions.RequestException as e:
+            self._count("failures")
+            self.breaker.record_failure()
+            print(f"KV {method} {path.split('/')[1]} failed: {e}")
+            return None
+        except BaseException:
+            # Any other error still ends the call, so a half-open trial is never left in
+            # flight with the circuit stuck open
+            self._count("failures")
+            self.breaker.record_failure()
+            raise
+        self.breaker.record_success()
+        return response
+
+    def _count(self, name: str) -> None:
+        with self._stats_lock:
+            self._stats[name] += 1
@@ -0,0 +1,95 @@
+import hashlib
+import re
+from typing import Any, Dict, Iterator, Optional, Tuple
+
+CACHE_KEY_VERSION = "v1"
+
+# Order matters: comments and quoted text must be matched before bare words so that
+# their contents are never case-folded or whitespace-collapsed.
+_TOKEN_PATTERN = re.compile(
+    r"""
+    (?P<line_comment>--[^\n]*|//[^\n]*)
+    | (?P<block_comment>/\*[\s\S]*?(?:\*/|$))
+    | (?P<string>'(?:[^'\\]|\\.|'')*(?:'|$))
+    | (?P<dollar_string>\$\$[\s\S]*?(?:\$\$|$))
+    | (?P<quoted_ident>"(?:[^"]|"")*(?:"|$))
+    | (?P<whitespace>\s+)
+    | (?P<word>[A-Za-z_][A-Za-z0-9_$]*)
+    | (?P<other>.)
+    """,
+    re.VERBOSE,
+)
+
+_CONTEXT_FIELDS = ("database", "schema", "role", "warehouse")
+
+
+def normalize_sql(query: str) -> str:
+    """
+    Canonicalize a SQL statement so that cosmetically different queries compare equal.
+
+    Comments are stripped, runs of whitespace collapse to a single space, keywords and
+    unquoted identifiers are case-folded and trailing semicolons are dropped. String
+    literals and quoted identifiers are kept verbatim.
+    """
+    parts = []
+    pending_space = False
+    for match in _TOKEN_PATTERN.finditer(query):
+        kind = match.lastgroup
+        token = match.group()
+        if kind in ("line_comment", "block_comment", "whitespace"):
+            pending_space = True
+            continue
+        if kind == "word":
+            token = token.upper()
+        if pending_space and parts and _needs_space(parts[-1], token):
+            parts.append(" ")
+        pending_space = False
+        parts.append(token)
+
+    normalized = "".join(parts).strip()
+    while normalized.endswith(";"):
+        normalized = normalized[:-1].rstrip()
+    return normalized
+
+
+def sql_tokens(query: str) -> Iterator[Tuple[str, str]]:
+    """Yields ``(kind, text)`` for every token of ``query`` except comments and whitespace."""
+    for match in _TOKEN_PATTERN.finditer(query):
+        if match.lastgroup not in ("line_comment", "block_comment", "whitespace"):
+            yield match.lastgroup, match.group()
+
+
+def sql_token_spans(query: str) -> Iterator[Tuple[str, str, int]]:
+    """Like ``sql_tokens``, also yielding the offset at which every token starts."""
+    for match in _TOKEN_PATTERN.finditer(query):
+        if match.lastgroup not in ("line_comment", "block_comment", "whitespace"):
+            yield match.lastgroup, match.group(), match.start()
+
+
+def _needs_space(previous: str, token: str) -> bool:
+    """A space is only kept between two tokens that would otherwise merge."""
+    if previous[-1] in "-/*" and token[0] in "-/*":
+        return True
+    return _is_word_char(previous[-1]) and _is_word_char(token[0])
+
+
+def _is_word_char(char: str) -> bool:
+    return char.isalnum() or char in "_$'\""
+
+
+def cache_key(query: str, context: Optional[Dict[str, Any]] = None) -> str:
+    """
+    Returns a fixed-length, URL-safe cache key for ``query`` run in the given session context.
+
+    Only the database, schema, role and warehouse entries of ``context`` are used, so the
+    Snowflake connection parameters can be passed in directly without leaking credentials
+    into the key.
+    """
+    context = context or {}
+    scope = "\x1f".join(
+        str(context.get(name) or "").upper() for name in _CONTEXT_FIELDS
+    )
+    digest = hashlib.sha256(
+        f"{scope}\x1e{normalize_sql(query)}".encode("utf-8")
+    ).hexdigest()
+    return f"snowchat-{CACHE_KEY_VERSION}-{digest}"
@@ -0,0 +1,147 @@
+import sys
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Optional
+
+
+@dataclass
+class CacheStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    def as_dict(self) -> Dict[str, Any]:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+@dataclass
+class _Entry:
+    value: Any
+    nbytes: int
+    expires_at: Optional[float] = field(default=None)
+
+
+class LRUCache:
+    """
+    Thread-safe, in-process LRU cache bounded by the total size of its values in bytes.
+
+    Every entry may carry its own time to live. Expired entries are dropped lazily when
+    they are looked up or when space is needed for a new entry.
+
+    Attributes
+    ----------
+    max_bytes : int
+        Upper bound on the summed size of all cached values.
+    default_ttl : float, optional
+        Time to live in seconds applied when ``set`` is called without one.
+    stats : CacheStats
+        Hit, miss, eviction and expiration counters.
+    """
+
+    def __init__(self, max_bytes: int, default_ttl: Optional[float] = None):
+        self.max_bytes = max_bytes
+        self.default_ttl = default_ttl
+        self.stats = CacheStats()
+        self._entries: "OrderedDict[str, _Entry]" = OrderedDict()
+        self._current_bytes = 0
+        self._lock = threading.Lock()
+
+    @property
+    def current_bytes(self) -> int:
+        return self._current_bytes
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: str) -> Optional[Any]:
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return None
+            if entry.expires_at is not None and entry.expires_at <= time.monotonic():
+                self._remove(key)
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return entry.value
+
+    def set(
+        self,
+        key: str,
+        value: Any,
+        ttl: Optional[float] = None,
+        nbytes: Optional[int] = None,
+    ) -> bool:
+        """
+        Store ``value`` under ``key``. Returns False if the value alone exceeds ``max_bytes``.
+        """
+        size = nbytes if nbytes is not None else self._sizeof(value)
+        if size > self.max_bytes:
+            return False
+
+        ttl = ttl if ttl is not None else self.default_ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+
+        with self._lock:
+            if key in self._entries:
+                self._remove(key)
+            self._make_room(size)
+            self._entries[key] = _Entry(value, size, expires_at)
+            self._current_bytes += size
+        return True
+
+    def delete(self, key: str) -> bool:
+        with self._lock:
+            if key not in self._entries:
+                return False
+            self._remove(key)
+            return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._current_bytes = 0
+
+    def _make_room(self, size: int) -> None:
+        if self._current_bytes + size <= self.max_bytes:
+            return
+
+        now = time.monotonic()
+        expired = [
+            key
+            for key, entry in self._entries.items()
+            if entry.expires_at is not None and entry.expires_at <= now
+        ]
+        for key in expired:
+            self._remove(key)
+            self.stats.expirations += 1
+
+        while self._entries and self._current_bytes + size > self.max_bytes:
+            key = next(iter(self._entries))
+            self._remove(key)
+            self.stats.evictions += 1
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key)
+        self._current_bytes -= entry.nbytes
+
+    @staticmethod
+    def _sizeof(value: Any) -> int:
+        if isinstance(value, (bytes, bytearray)):
+            return len(value)
+        if isinstance(value, str):
+            return len(value.encode("utf-8"))
+        return sys.getsizeof(value)
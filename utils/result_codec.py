@@ -0,0 +1,85 @@
+import json
+import struct
+from typing import Any, Dict, Optional, Tuple
+
+import pandas as pd
+
+# Layout: MAGIC | version (u8) | flags (u8) | meta length (u32, big endian) | meta JSON |
+# Arrow IPC stream. Bump FORMAT_VERSION when the layout changes; older payloads are then
+# rejected and treated as cache misses.
+MAGIC = b"SNWR"
+FORMAT_VERSION = 1
+FLAG_COMPRESSED = 0x01
+_HEADER = struct.Struct(">4sBBI")
+
+DEFAULT_COMPRESS_THRESHOLD = 64 * 1024
+
+
+class ResultCodecError(ValueError):
+    """Raised when a payload is not a cached result in a format this version can read."""
+
+
+def encode_result(
+    frame: pd.DataFrame,
+    meta: Optional[Dict[str, Any]] = None,
+    compress_threshold: int = DEFAULT_COMPRESS_THRESHOLD,
+) -> bytes:
+    """
+    Serializes a query result as a columnar Arrow IPC stream behind a versioned header.
+
+    Column types (dates, timestamps, decimals) survive the round trip, and results whose
+    Arrow size exceeds ``compress_threshold`` bytes are zstd-compressed.
+    """
+    import pyarrow as pa
+
+    table = pa.Table.from_pandas(frame, preserve_index=False)
+    flags = 0
+    options = None
+    if table.nbytes > compress_threshold:
+        flags |= FLAG_COMPRESSED
+        options = pa.ipc.IpcWriteOptions(compression="zstd")
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema, options=options) as writer:
+        writer.write_table(table)
+
+    meta_bytes = json.dumps(meta or {}, separators=(",", ":")).encode("utf-8")
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, flags, len(meta_bytes))
+    return header + meta_bytes + sink.getvalue().to_pybytes()
+
+
+def decode_meta(payload: bytes) -> Tuple[Dict[str, Any], int]:
+    """Returns the metadata of a payload and the offset at which its Arrow stream starts."""
+    if len(payload) < _HEADER.size:
+        raise ResultCodecError("Payload is too short to be a cached result")
+    magic, version, _flags, meta_length = _HEADER.unpack_from(payload)
+    if magic != MAGIC:
+        raise ResultCodecError("Payload is not a cached result")
+    if version != FORMAT_VERSION:
+        raise ResultCodecError(f"Unsupported cached result version {version}")
+    start = _HEADER.size
+    if len(payload) < start + meta_length:
+        raise ResultCodecError("Cached result is truncated")
+    try:
+        meta = json.loads(bytes(payload[start : start + meta_length]).decode("utf-8"))
+    except (UnicodeDecodeError, ValueError) as e:
+        raise ResultCodecError(f"Corrupt cached result metadata: {e}") from e
+    if not isinstance(meta, dict):
+        raise ResultCodecError("Corrupt cached result metadata")
+    return meta, start + meta_length
+
+
+def decode_result(payload: bytes) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Loads a payload written by ``encode_result`` into a DataFrame. The Arrow stream is read
+    in place from ``payload``; fixed-width columns without nulls are not copied again.
+    """
+    import pyarrow as pa
+
+    meta, offset = decode_meta(payload)
+    buffer = pa.py_buffer(payload)
+    try:
+        table = pa.ipc.open_stream(buffer.slice(offset)).read_all()
+    except pa.ArrowInvalid as e:
+        raise ResultCodecError(f"Corrupt cached result: {e}") from e
+    return table.to_pandas(), meta
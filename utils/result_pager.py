@@ -0,0 +1,150 @@
+import threading
+import weakref
+from typing import Callable, Iterable, Iterator, List, Optional
+
+import pandas as pd
+
+from utils.session_pool import SessionPool
+
+
+def frame_nbytes(frame: pd.DataFrame) -> int:
+    return int(frame.memory_usage(index=False, deep=True).sum())
+
+
+class ResultPager:
+    """
+    Pages through a query result that is fetched as a stream of pandas batches.
+
+    Batches are pulled from Snowflake only when a page needs them, and fetching stops for good
+    once ``max_rows`` rows or ``max_bytes`` bytes have been read, so a careless ``SELECT *``
+    never holds more than the cap in memory. ``truncated`` tells whether rows were left out.
+
+    Attributes
+    ----------
+    page_size : int
+        Number of rows returned by ``next_page``.
+    max_rows : int
+        Hard cap on the rows fetched over the pager's lifetime.
+    max_bytes : int
+        Hard cap on the in-memory size of the fetched rows.
+    rows_fetched : int
+        Rows read from Snowflake so far.
+    bytes_fetched : int
+        In-memory size of the rows read so far.
+    truncated : bool
+        Whether the cap was hit before the result was exhausted.
+    """
+
+    def __init__(
+        self,
+        batches: Iterable[pd.DataFrame],
+        page_size: int = 500,
+        max_rows: int = 10_000,
+        max_bytes: int = 64 * 1024 * 1024,
+        on_close: Optional[Callable[[], None]] = None,
+    ):
+        self.page_size = page_size
+        self.max_rows = max_rows
+        self.max_bytes = max_bytes
+        self.rows_fetched = 0
+        self.bytes_fetched = 0
+        self.truncated = False
+        self._batches: Optional[Iterator[pd.DataFrame]] = iter(batches)
+        self._buffer: List[pd.DataFrame] = []
+        self._buffered_rows = 0
+        self._lock = threading.Lock()
+        # Releases the session when the pager is exhausted, closed or garbage collected
+        self._finalizer = weakref.finalize(self, on_close) if on_close else None
+
+    @classmethod
+    def from_query(cls, pool: SessionPool, query: str, **kwargs) -> "ResultPager":
+        """
+        Starts ``query`` on a pooled session. The session stays checked out until the result
+        is exhausted, the cap is reached, or the pager is detached or closed; a pager kept
+        across Streamlit reruns should be detached so it does not hold on to the session.
+        """
+        session = pool.acquire()
+        try:
+            batches = session.sql(query).to_pandas_batches()
+        except BaseException:
+            pool.release(session)
+            raise
+        return cls(batches, on_close=lambda: pool.release(session), **kwargs)
+
+    @property
+    def has_more(self) -> bool:
+        return self._buffered_rows > 0 or self._batches is not None
+
+    def next_page(self) -> Optional[pd.DataFrame]:
+        """Returns the next ``page_size`` rows, or None when nothing is left."""
+        with self._lock:
+            while self._buffered_rows < self.page_size and self._fetch():
+                pass
+            if not self._buffered_rows:
+                return None
+            return self._take(self.page_size)
+
+    def read_all(self) -> pd.DataFrame:
+        """Returns every remaining row up to the cap as one DataFrame."""
+        with self._lock:
+            while self._fetch():
+                pass
+            return self._take(self._buffered_rows)
+
+    def detach(self) -> None:
+        """
+        Fetches the rest of the result up to the cap and releases the session. Later pages
+        are served from memory.
+        """
+        with self._lock:
+            while self._fetch():
+                pass
+
+    def close(self) -> None:
+        self._batches = None
+        if self._finalizer is not None:
+            self._finalizer()
+
+    def _fetch(self) -> bool:
+        if self._batches is None:
+            return False
+        batch = next(self._batches, None)
+        if batch is None:
+            self.close()
+            return False
+
+        rows_left = self.max_rows - self.rows_fetched
+        if len(batch) > rows_left:
+            batch = batch.iloc[:rows_left]
+            self.truncated = True
+        nbytes = frame_nbytes(batch)
+        if self.bytes_fetched + nbytes > self.max_bytes:
+            # Keep the share of rows that fits, assuming rows of similar size
+            fits = int(len(batch) * (self.max_bytes - self.bytes_fetched) / max(nbytes, 1))
+            batch = batch.iloc[: max(fits, 0)]
+            nbytes = frame_nbytes(batch)
+            self.truncated = True
+
+        self.rows_fetched += len(batch)
+        self.bytes_fetched += nbytes
+        if len(batch):
+            self._buffer.append(batch)
+            self._buffered_rows += len(batch)
+        if self.truncated:
+            print(
+                f"Query result truncated at {self.rows_fetched} rows "
+                f"({self.bytes_fetched} bytes)"
+            )
+            self.close()
+        return True
+
+    def _take(self, rows: int) -> pd.DataFrame:
+        if not self._buffer:
+            return pd.DataFrame()
+        frame = (
+            self._buffer[0] if len(self._buffer) == 1 else pd.concat(self._buffer, ignore_index=True)
+        )
+        page, rest = frame.iloc[:rows], frame.iloc[rows:]
+        self._buffer = [rest] if len(rest) else []
+        self._buffered_rows = len(rest)
+        return page.reset_index(drop=True)
@@ -0,0 +1,154 @@
+import hashlib
+import os
+import re
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Dict, Hashable, Optional, Tuple
+
+import numpy as np
+from langchain_core.embeddings import Embeddings
+
+# Numbers (1,000 / 2.5 / 2024) and quoted literals
+_LITERAL_PATTERN = re.compile(
+    r"\d+(?:[.,]\d+)*|'[^']*'|\"[^\"]*\"|\u201c[^\u201d]*\u201d|\u2018[^\u2019]*\u2019"
+)
+
+
+def question_literals(question: str) -> Tuple[str, ...]:
+    """
+    Numbers and quoted literals of a question, sorted. Embeddings barely tell "top 5" from
+    "top 10" or "in 2023" from "in 2024", so questions only match if these are equal.
+    """
+    literals = []
+    for match in _LITERAL_PATTERN.finditer(question):
+        literal = match.group()
+        if literal[0].isdigit():
+            literal = literal.replace(",", "")
+        else:
+            literal = literal[1:-1].strip().lower()
+        literals.append(literal)
+    return tuple(sorted(literals))
+
+
+@dataclass
+class _Entry:
+    question: str
+    answer: str
+    # Scope of the entry together with the literals of its question
+    group: Hashable
+    vector: np.ndarray
+    created_at: float = field(default_factory=time.monotonic)
+    hits: int = 0
+
+
+class SemanticCache:
+    """
+    Caches agent answers keyed on the embedding of the question.
+
+    A lookup embeds the incoming question and returns the answer of the most similar earlier
+    question in the same scope (e.g. model and schema version) when their cosine similarity
+    is at least ``threshold`` and both questions contain the same numbers and quoted
+    literals, see ``question_literals``. Entries expire after ``ttl`` seconds, and the least recently
+    used entry is evicted once ``max_entries`` is reached.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        threshold: float = 0.95,
+        ttl: Optional[float] = 24 * 60 * 60,
+        max_entries: int = 1000,
+    ):
+        self.embeddings = embeddings
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._matrices: Dict[Hashable, Tuple[list, np.ndarray]] = {}
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self._stats = {"hits": 0, "misses": 0, "stores": 0, "evictions": 0, "expirations": 0}
+
+    def lookup(self, question: str, scope: Hashable) -> Optional[str]:
+        vector = self._embed(question)
+        with self._lock:
+            self._expire()
+            ids, matrix = self._matrix((scope, question_literals(question)))
+            if ids:
+                scores = matrix @ vector
+                best = int(np.argmax(scores))
+                if scores[best] >= self.threshold:
+                    entry = self._entries[ids[best]]
+                    entry.hits += 1
+                    self._entries.move_to_end(ids[best])
+                    self._stats["hits"] += 1
+                    print(f"Semantic cache hit ({scores[best]:.3f}): {entry.question!r}")
+                    return entry.answer
+            self._stats["misses"] += 1
+            return None
+
+    def store(self, question: str, answer: str, scope: Hashable) -> None:
+        vector = self._embed(question)
+        group = (scope, question_literals(question))
+        with self._lock:
+            self._entries[self._next_id] = _Entry(question, answer, group, vector)
+            self._next_id += 1
+            self._matrices.pop(group, None)
+            self._stats["stores"] += 1
+            while len(self._entries) > self.max_entries:
+                _, evicted = self._entries.popitem(last=False)
+                self._matrices.pop(evicted.group, None)
+                self._stats["evictions"] += 1
+
+    def stats(self) -> Dict[str, Any]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["entries"] = len(self._entries)
+        lookups = stats["hits"] + stats["misses"]
+        stats["hit_rate"] = stats["hits"] / lookups if lookups else 0.0
+        return stats
+
+    def _embed(self, question: str) -> np.ndarray:
+        vector = np.asarray(
+            self.embeddings.embed_query(" ".join(question.lower().split())),
+            dtype=np.float32,
+        )
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _matrix(self, group: Hashable) -> Tuple[list, np.ndarray]:
+        """Stacked vectors of one group, rebuilt only after that group changed."""
+        if group not in self._matrices:
+            ids = [id_ for id_, entry in self._entries.items() if entry.group == group]
+            matrix = (
+                np.stack([self._entries[id_].vector for id_ in ids])
+                if ids
+                else np.zeros((0, 0), dtype=np.float32)
+            )
+            self._matrices[group] = (ids, matrix)
+        return self._matrices[group]
+
+    def _expire(self) -> None:
+        if self.ttl is None:
+            return
+        cutoff = time.monotonic() - self.ttl
+        expired = [id_ for id_, entry in self._entries.items() if entry.created_at < cutoff]
+        for id_ in expired:
+            entry = self._entries.pop(id_)
+            self._matrices.pop(entry.group, None)
+            self._stats["expirations"] += 1
+
+
+def file_fingerprint(*paths: str) -> str:
+    """
+    Short digest of the given files' contents; missing files are skipped. Used as a schema
+    version so cached answers are not reused after the schema docs are re-ingested.
+    """
+    digest = hashlib.sha256()
+    for path in paths:
+        if os.path.exists(path):
+            with open(path, "rb") as f:
+                digest.update(path.encode("utf-8") + b"\0" + f.read())
+    return digest.hexdigest()[:16]
@@ -0,0 +1,213 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Any, Deque, Dict, Iterator, Optional
+
+from snowflake.snowpark.exceptions import SnowparkSQLException
+from snowflake.snowpark.session import Session
+
+
+@dataclass
+class _IdleSession:
+    session: Session
+    last_used: float
+
+
+class SessionPool:
+    """
+    Thread-safe pool of Snowpark sessions shared by every caller in the process.
+
+    Sessions are created on demand up to ``max_size`` and handed back to the pool after use
+    instead of being closed, so the login handshake is paid once per session rather than
+    once per query. Sessions idle for longer than ``idle_timeout`` are closed, keeping at
+    least ``min_size`` warm, and a session that has been idle longer than
+    ``health_check_interval`` is pinged before it is handed out again.
+
+    Attributes
+    ----------
+    connection_parameters : Dict[str, Any]
+        Parameters passed to ``Session.builder.configs``.
+    min_size : int
+        Number of idle sessions that are never evicted.
+    max_size : int
+        Maximum number of open sessions, idle and checked out.
+    idle_timeout : float
+        Seconds after which an idle session above ``min_size`` is closed.
+    health_check_interval : float
+        Idle seconds after which a session is pinged before reuse.
+    checkout_timeout : float
+        Seconds ``acquire`` waits for a free session before raising ``TimeoutError``.
+    """
+
+    def __init__(
+        self,
+        connection_parameters: Dict[str, Any],
+        min_size: int = 1,
+        max_size: int = 8,
+        idle_timeout: float = 600.0,
+        health_check_interval: float = 60.0,
+        checkout_timeout: float = 30.0,
+    ):
+        if min_size < 0 or max_size < 1 or min_size > max_size:
+            raise ValueError("Expected 0 <= min_size <= max_size and max_size >= 1")
+        self.connection_parameters = {
+            "client_session_keep_alive": True,
+            **connection_parameters,
+        }
+        self.min_size = min_size
+        self.max_size = max_size
+        self.idle_timeout = idle_timeout
+        self.health_check_interval = health_check_interval
+        self.checkout_timeout = checkout_timeout
+        self._idle: Deque[_IdleSession] = deque()
+        self._size = 0
+        self._closed = False
+        self._condition = threading.Condition()
+
+    def acquire(self, timeout: Optional[float] = None) -> Session:
+        """
+        Checks a session out of the pool, creating one if none is idle and the pool has room.
+        Every acquired session must be handed back with ``release``.
+        """
+        timeout = self.checkout_timeout if timeout is None else timeout
+        deadline = time.monotonic() + timeout
+        while True:
+            idle = None
+            with self._condition:
+                if self._closed:
+                    raise RuntimeError("Session pool is closed")
+                stale = self._evict_idle()
+                if self._idle:
+                    idle = self._idle.pop()
+                elif self._size < self.max_size:
+                    self._size += 1
+                else:
+                    remaining = deadline - time.monotonic()
+                    if remaining <= 0 or not self._condition.wait(remaining):
+                        raise TimeoutError(
+                            f"No Snowflake session available after {timeout} seconds"
+                        )
+                    continue
+            self._close_all(stale)
+
+            if idle is None:
+                return self._create()
+            if time.monotonic() - idle.last_used < self.health_check_interval:
+                return idle.session
+            if self._is_healthy(idle.session):
+                return idle.session
+            self._discard(idle.session)
+
+    def release(self, session: Session, discard: bool = False) -> None:
+        """
+        Returns a checked-out session to the pool, or closes it when ``discard`` is set.
+        """
+        if discard:
+            self._discard(session)
+            return
+        with self._condition:
+            if not self._closed:
+                self._idle.append(_IdleSession(session, time.monotonic()))
+                self._condition.notify()
+                return
+            self._size -= 1
+        self._close_quietly(session)
+
+    @contextmanager
+    def session(self, timeout: Optional[float] = None) -> Iterator[Session]:
+        """
+        Context manager that checks a session out and returns it when the block exits.
+        Sessions that fail with anything other than a SQL error are discarded.
+        """
+        session = self.acquire(timeout)
+        try:
+            yield session
+        except SnowparkSQLException:
+            self.release(session)
+            raise
+        except BaseException:
+            self.release(session, discard=True)
+            raise
+        else:
+            self.release(session)
+
+    def warm(self) -> None:
+        """Opens sessions until ``min_size`` of them are idle."""
+        sessions = []
+        try:
+            while len(sessions) < self.min_size:
+                sessions.append(self.acquire())
+        finally:
+            for session in sessions:
+                self.release(session)
+
+    def close(self) -> None:
+        """Closes every idle session. Checked-out sessions are closed when released."""
+        with self._condition:
+            self._closed = True
+            idle = list(self._idle)
+            self._idle.clear()
+            self._size -= len(idle)
+            self._condition.notify_all()
+        self._close_all(idle)
+
+    def stats(self) -> Dict[str, int]:
+        with self._condition:
+            return {
+                "size": self._size,
+                "idle": len(self._idle),
+                "in_use": self._size - len(self._idle),
+                "max_size": self.max_size,
+            }
+
+    def _create(self) -> Session:
+        try:
+            session = Session.builder.configs(self.connection_parameters).create()
+            session.sql_simplifier_enabled = True
+            return session
+        except BaseException:
+            with self._condition:
+                self._size -= 1
+                self._condition.notify()
+            raise
+
+    def _discard(self, session: Session) -> None:
+        with self._condition:
+            self._size -= 1
+            self._condition.notify()
+        self._close_quietly(session)
+
+    def _evict_idle(self):
+        """Pops sessions idle past ``idle_timeout``; must be called with the lock held."""
+        now = time.monotonic()
+        stale = []
+        # The deque is ordered oldest first, so expired sessions sit at the left end.
+        while (
+            len(self._idle) > self.min_size
+            and now - self._idle[0].last_used > self.idle_timeout
+        ):
+            stale.append(self._idle.popleft())
+        self._size -= len(stale)
+        return stale
+
+    def _close_all(self, idle_sessions) -> None:
+        for idle in idle_sessions:
+            self._close_quietly(idle.session)
+
+    @staticmethod
+    def _is_healthy(session: Session) -> bool:
+        try:
+            session.sql("select 1").collect()
+            return True
+        except Exception as e:
+            print(f"Discarding unhealthy Snowflake session: {e}")
+            return False
+
+    @staticmethod
+    def _close_quietly(session: Session) -> None:
+        try:
+            session.close()
+        except Exception as e:
+            print(f"Failed to close Snowflake session: {e}")
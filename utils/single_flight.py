@@ -0,0 +1,51 @@
+import threading
+from concurrent.futures import Future
+from typing import Callable, Dict, Hashable, TypeVar
+
+T = TypeVar("T")
+
+
+class SingleFlight:
+    """
+    Coalesces concurrent calls that share a key.
+
+    The first caller of ``do`` for a key runs the function; callers arriving while it runs
+    wait for it and receive the same result, or the same exception. Once the call finishes
+    the key is released, so later callers start a new call. Safe to use across threads,
+    e.g. Streamlit script threads of one process.
+    """
+
+    def __init__(self):
+        self._calls: Dict[Hashable, Future] = {}
+        self._lock = threading.Lock()
+        self._stats = {"calls": 0, "shared": 0}
+
+    def do(self, key: Hashable, fn: Callable[[], T]) -> T:
+        with self._lock:
+            future = self._calls.get(key)
+            leader = future is None
+            if leader:
+                future = self._calls[key] = Future()
+                self._stats["calls"] += 1
+            else:
+                self._stats["shared"] += 1
+        if not leader:
+            return future.result()
+
+        try:
+            result = fn()
+        except BaseException as e:
+            future.set_exception(e)
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            with self._lock:
+                del self._calls[key]
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            stats = dict(self._stats)
+            stats["in_flight"] = len(self._calls)
+        return stats
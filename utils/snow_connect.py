@@ -1,9 +1,217 @@
-from typing import Any, Dict
-import json
-import requests
+from typing import Any, Dict, List, Optional, Tuple
+import atexit
+import threading
+import time
+import pandas as pd
 import streamlit as st
 from snowflake.snowpark.session import Session
 
+from utils.async_runtime import run_blocking
+from utils.cache_invalidation import CacheInvalidator, scan_tables
+from utils.cost_guard import CostBudget, CostGuard
+from utils.kv_client import KVClient
+from utils.query_key import cache_key
+from utils.result_cache import LRUCache
+from utils.result_codec import (
+    DEFAULT_COMPRESS_THRESHOLD,
+    ResultCodecError,
+    decode_result,
+    encode_result,
+)
+from utils.result_pager import ResultPager, frame_nbytes
+from utils.session_pool import SessionPool
+from utils.single_flight import SingleFlight
+from utils.write_behind import WriteBehindQueue
+
+DEFAULT_RESULT_CACHE_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_RESULT_CACHE_TTL = 15 * 60
+DEFAULT_SQL_MAX_ROWS = 10_000
+DEFAULT_SQL_MAX_BYTES = 64 * 1024 * 1024
+DEFAULT_RESULT_KV_TTL = 24 * 60 * 60
+# Results whose tables are not known for sure cannot be invalidated, so they are only kept
+# in-process and briefly
+DEFAULT_UNTRACKED_RESULT_TTL = 60
+DEFAULT_STATEMENT_TIMEOUT = 120
+
+_result_cache = None
+_result_cache_lock = threading.Lock()
+
+_session_pool = None
+_session_pool_lock = threading.Lock()
+
+_kv_client = None
+_kv_client_lock = threading.Lock()
+
+_cache_writer = None
+_cache_writer_lock = threading.Lock()
+
+_cache_invalidator = None
+_cache_invalidator_lock = threading.Lock()
+
+# In-flight cache misses of this process, keyed on the cache key
+query_flights = SingleFlight()
+
+
+def get_result_cache() -> LRUCache:
+    """
+    Returns the process-wide in-memory result cache that sits in front of Cloudflare KV.
+    Its size and TTL can be tuned with RESULT_CACHE_MAX_BYTES and RESULT_CACHE_TTL secrets.
+    """
+    global _result_cache
+    if _result_cache is None:
+        with _result_cache_lock:
+            if _result_cache is None:
+                _result_cache = LRUCache(
+                    max_bytes=int(
+                        st.secrets.get(
+                            "RESULT_CACHE_MAX_BYTES", DEFAULT_RESULT_CACHE_MAX_BYTES
+                        )
+                    ),
+                    default_ttl=float(
+                        st.secrets.get("RESULT_CACHE_TTL", DEFAULT_RESULT_CACHE_TTL)
+                    ),
+                )
+    return _result_cache
+
+
+def get_session_pool() -> SessionPool:
+    """
+    Returns the process-wide Snowpark session pool. Its bounds can be tuned with the
+    SESSION_POOL_MIN_SIZE, SESSION_POOL_MAX_SIZE and SESSION_POOL_IDLE_TIMEOUT secrets.
+    Every pooled session cancels statements running longer than SQL_STATEMENT_TIMEOUT
+    seconds (0 disables the timeout).
+    """
+    global _session_pool
+    if _session_pool is None:
+        with _session_pool_lock:
+            if _session_pool is None:
+                connection_parameters = SnowflakeConnection._get_connection_parameters_from_env()
+                statement_timeout = get_statement_timeout()
+                if statement_timeout:
+                    connection_parameters["session_parameters"] = {
+                        "STATEMENT_TIMEOUT_IN_SECONDS": statement_timeout
+                    }
+                _session_pool = SessionPool(
+                    connection_parameters,
+                    min_size=int(st.secrets.get("SESSION_POOL_MIN_SIZE", 1)),
+                    max_size=int(st.secrets.get("SESSION_POOL_MAX_SIZE", 8)),
+                    idle_timeout=float(
+                        st.secrets.get("SESSION_POOL_IDLE_TIMEOUT", 600)
+                    ),
+                )
+                atexit.register(_session_pool.close)
+    return _session_pool
+
+
+def get_statement_timeout() -> int:
+    return int(st.secrets.get("SQL_STATEMENT_TIMEOUT", DEFAULT_STATEMENT_TIMEOUT))
+
+
+def sql_guard_enabled() -> bool:
+    """Whether queries are checked with the cost guard; turned off with the SQL_GUARD secret."""
+    return bool(st.secrets.get("SQL_GUARD", True))
+
+
+def get_cost_guard() -> CostGuard:
+    """
+    Returns the guard that checks queries with EXPLAIN before they run. Its budgets are set
+    with the SQL_GUARD_MAX_SCAN_BYTES, SQL_GUARD_REJECT_SCAN_BYTES, SQL_GUARD_MAX_PARTITIONS
+    and SQL_GUARD_LIMIT_ROWS secrets.
+    """
+    return CostGuard(
+        CostBudget(
+            max_scan_bytes=int(st.secrets.get("SQL_GUARD_MAX_SCAN_BYTES", 10 * 1024**3)),
+            reject_scan_bytes=int(
+                st.secrets.get("SQL_GUARD_REJECT_SCAN_BYTES", 100 * 1024**3)
+            ),
+            max_partitions=int(st.secrets.get("SQL_GUARD_MAX_PARTITIONS", 10_000)),
+            limit_rows=int(st.secrets.get("SQL_GUARD_LIMIT_ROWS", DEFAULT_SQL_MAX_ROWS)),
+            statement_timeout=get_statement_timeout(),
+        )
+    )
+
+
+def get_kv_client() -> KVClient:
+    """
+    Returns the process-wide Cloudflare KV client. Its timeouts and circuit breaker can be
+    tuned with the KV_CONNECT_TIMEOUT, KV_READ_TIMEOUT, KV_FAILURE_THRESHOLD and
+    KV_RESET_TIMEOUT secrets.
+    """
+    global _kv_client
+    if _kv_client is None:
+        with _kv_client_lock:
+            if _kv_client is None:
+                _kv_client = KVClient(
+                    account_id=st.secrets["CLOUDFLARE_ACCOUNT_ID"],
+                    namespace_id=st.secrets["CLOUDFLARE_NAMESPACE_ID"],
+                    api_token=st.secrets["CLOUDFLARE_API_TOKEN"],
+                    connect_timeout=float(st.secrets.get("KV_CONNECT_TIMEOUT", 2)),
+                    read_timeout=float(st.secrets.get("KV_READ_TIMEOUT", 5)),
+                    failure_threshold=int(st.secrets.get("KV_FAILURE_THRESHOLD", 5)),
+                    reset_timeout=float(st.secrets.get("KV_RESET_TIMEOUT", 30)),
+                )
+                atexit.register(_kv_client.close)
+    return _kv_client
+
+
+def get_cache_writer() -> WriteBehindQueue:
+    """
+    Returns the process-wide queue that serializes query results and writes them to KV in
+    the background, expiring after RESULT_KV_TTL seconds. At most CACHE_WRITE_MAX_PENDING
+    writes wait; pending writes are flushed when the process exits.
+    """
+    global _cache_writer
+    if _cache_writer is None:
+        with _cache_writer_lock:
+            if _cache_writer is None:
+                kv = get_kv_client()
+                compress_threshold = int(
+                    st.secrets.get("RESULT_COMPRESS_THRESHOLD", DEFAULT_COMPRESS_THRESHOLD)
+                )
+                kv_ttl = int(st.secrets.get("RESULT_KV_TTL", DEFAULT_RESULT_KV_TTL))
+
+                def write(key: str, item: Tuple[pd.DataFrame, Dict[str, Any]]) -> None:
+                    frame, meta = item
+                    payload = encode_result(frame, meta, compress_threshold=compress_threshold)
+                    if not kv.put(key, payload, expiration_ttl=kv_ttl):
+                        raise RuntimeError(f"KV rejected the write ({kv.breaker.state} circuit)")
+
+                _cache_writer = WriteBehindQueue(
+                    write,
+                    max_pending=int(st.secrets.get("CACHE_WRITE_MAX_PENDING", 256)),
+                    name="snowchat-cache-writer",
+                )
+                # Registered after the KV client, so it runs first and flushes while KV is open
+                atexit.register(_cache_writer.close)
+    return _cache_writer
+
+
+def get_cache_invalidator() -> CacheInvalidator:
+    """
+    Returns the process-wide invalidator that drops cached results of queries whose tables
+    changed, polling every CACHE_INVALIDATION_INTERVAL seconds (0 disables polling).
+    """
+    global _cache_invalidator
+    if _cache_invalidator is None:
+        with _cache_invalidator_lock:
+            if _cache_invalidator is None:
+                result_cache = get_result_cache()
+                kv = get_kv_client()
+
+                def invalidate(keys: List[str]) -> None:
+                    for key in keys:
+                        result_cache.delete(key)
+                    kv.bulk_delete(keys)
+
+                _cache_invalidator = CacheInvalidator(
+                    get_session_pool(),
+                    invalidate,
+                    interval=float(st.secrets.get("CACHE_INVALIDATION_INTERVAL", 60)),
+                )
+                _cache_invalidator.start()
+                atexit.register(_cache_invalidator.stop)
+    return _cache_invalidator
+
 
 class SnowflakeConnection:
     """
@@ -14,26 +222,55 @@ class SnowflakeConnection:
     connection_parameters : Dict[str, Any]
         A dictionary containing the connection parameters for Snowflake.
     session : snowflake.snowpark.Session
-        A Snowflake session object.
+        A dedicated Snowflake session object, only opened by get_session().
+    session_pool : SessionPool
+        Process-wide pool that execute_query checks sessions out of.
+    result_cache : LRUCache
+        Process-local result cache checked before Cloudflare KV.
+    kv : KVClient
+        Process-wide Cloudflare KV client with pooled connections and a circuit breaker.
+    cache_writer : WriteBehindQueue
+        Background queue that new results are written to KV through.
+    cache_invalidator : CacheInvalidator
+        Tracks the tables behind cached results and drops results whose tables changed.
+    cost_guard : CostGuard
+        Estimates a query's scan with EXPLAIN and limits or rejects expensive queries.
+    max_rows, max_bytes : int
+        Hard caps on the rows and in-memory bytes fetched for one query.
 
     Methods
     -------
     get_session()
-        Establishes and returns the Snowflake connection session.
+        Establishes and returns a dedicated Snowflake connection session.
     execute_query(query: str, use_cache: bool = True)
         Executes a Snowflake SQL query with optional caching.
+    execute_query_frame(query: str, use_cache: bool = True)
+        Same as execute_query, returning the result as a pandas DataFrame.
+    execute_query_result(query: str, use_cache: bool = True, guard: bool = False)
+        Same as execute_query_frame, also returning the result's metadata.
+    execute_guarded(query: str, use_cache: bool = True)
+        Same as execute_query_result, checking cache misses with the cost guard first.
+    aexecute_query(query: str, use_cache: bool = True)
+        Async variant of execute_query, run on the bounded blocking executor.
+    cache_stats()
+        Returns counters for the in-process result cache.
     """
 
     def __init__(self):
         self.connection_parameters = self._get_connection_parameters_from_env()
         self.session = None
-        self.cloudflare_account_id = st.secrets["CLOUDFLARE_ACCOUNT_ID"]
-        self.cloudflare_namespace_id = st.secrets["CLOUDFLARE_NAMESPACE_ID"]
-        self.cloudflare_api_token = st.secrets["CLOUDFLARE_API_TOKEN"]
-        self.headers = {
-            "Authorization": f"Bearer {self.cloudflare_api_token}",
-            "Content-Type": "application/json"
-        }
+        self.session_pool = get_session_pool()
+        self.result_cache = get_result_cache()
+        self.max_rows = int(st.secrets.get("SQL_MAX_ROWS", DEFAULT_SQL_MAX_ROWS))
+        self.max_bytes = int(st.secrets.get("SQL_MAX_BYTES", DEFAULT_SQL_MAX_BYTES))
+        self.kv = get_kv_client()
+        self.cache_writer = get_cache_writer()
+        self.cache_invalidator = get_cache_invalidator()
+        self.cost_guard = get_cost_guard()
+        self.kv_ttl = int(st.secrets.get("RESULT_KV_TTL", DEFAULT_RESULT_KV_TTL))
+        self.untracked_result_ttl = float(
+            st.secrets.get("UNTRACKED_RESULT_TTL", DEFAULT_UNTRACKED_RESULT_TTL)
+        )
 
     @staticmethod
     def _get_connection_parameters_from_env() -> Dict[str, Any]:
@@ -49,7 +286,8 @@ class SnowflakeConnection:
 
     def get_session(self):
         """
-        Establishes and returns the Snowflake connection session.
+        Establishes and returns a dedicated Snowflake connection session.
+        Prefer checking a session out of ``session_pool`` for short-lived work.
         Returns:
             session: Snowflake connection session.
         """
@@ -58,44 +296,169 @@ class SnowflakeConnection:
             self.session.sql_simplifier_enabled = True
         return self.session
 
-    def _construct_kv_url(self, key: str) -> str:
-        return f"https://api.cloudflare.com/client/v4/accounts/{self.cloudflare_account_id}/storage/kv/namespaces/{self.cloudflare_namespace_id}/values/{key}"
-
-    def get_from_cache(self, key: str) -> str:
-        url = self._construct_kv_url(key)
-        try:
-            response = requests.get(url, headers=self.headers)
-            response.raise_for_status()
+    def get_from_cache(self, key: str) -> Optional[bytes]:
+        value = self.kv.get(key)
+        if value is not None:
             print("\n\n\nCache hit\n\n\n")
-            return response.text
-        except requests.exceptions.RequestException as e:
-            print(f"Cache miss or error: {e}")
-        return None
-
-    def set_to_cache(self, key: str, value: str) -> None:
-        url = self._construct_kv_url(key)
-        serialized_value = json.dumps(value)
-        try:
-            response = requests.put(url, headers=self.headers, data=serialized_value)
-            response.raise_for_status()
-            print("Cache set successfully")
-        except requests.exceptions.RequestException as e:
-            print(f"Failed to set cache: {e}")
+        return value
 
     def execute_query(self, query: str, use_cache: bool = True) -> str:
         """
-        Execute a Snowflake SQL query with optional caching.
+        Execute a Snowflake SQL query with optional caching and return its rows as dicts.
+        """
+        return self.execute_query_frame(query, use_cache).to_dict("records")
+
+    def execute_query_frame(self, query: str, use_cache: bool = True) -> pd.DataFrame:
+        """
+        Execute a Snowflake SQL query with optional caching, see ``execute_query_result``.
+        """
+        return self.execute_query_result(query, use_cache)[0]
+
+    def execute_query_result(
+        self, query: str, use_cache: bool = True, guard: bool = False
+    ) -> Tuple[Optional[pd.DataFrame], Dict[str, Any]]:
+        """
+        Execute a Snowflake SQL query with optional caching and return the result with its
+        metadata. ``truncated`` in the metadata tells whether the row/byte cap cut the result
+        short, in which case only ``rows_fetched`` rows were fetched.
+
+        With ``guard``, a query that misses both cache tiers is checked with the cost guard
+        before it runs: it may run rewritten with a LIMIT, or not at all, in which case the
+        result is None. The guard's report is kept in the ``cost_guard`` metadata entry and
+        rejections are not cached.
+
+        Results are looked up in the in-process cache first, then in Cloudflare KV.
+        At most ``max_rows`` rows (and ``max_bytes`` bytes) of a result are fetched.
+        New results are stored in-process at once and written to KV in the background.
+        Both tiers are keyed on a digest of the normalized query and the session context,
+        see ``utils.query_key.cache_key``. Entries record the tables the query reads and are
+        invalidated once one of them changes, see ``utils.cache_invalidation``.
+        Results whose tables cannot all be identified are not written to KV and are only
+        kept in-process for ``untracked_result_ttl`` seconds.
+        Identical queries that miss the in-process cache at the same time, from any thread,
+        are executed once and share the result.
+        The returned DataFrame and metadata may be shared with other callers and must not be
+        modified.
         """
+        key = cache_key(query, self.connection_parameters)
+        if use_cache:
+            cached_result = self.result_cache.get(key)
+            if cached_result is not None:
+                return cached_result
+
+        # Concurrent misses for the same query share one KV lookup, one cost check, one
+        # warehouse query and one cache fill
+        return query_flights.do(
+            (key, use_cache, guard),
+            lambda: self._load_result(query, key, use_cache, guard),
+        )
+
+    def _load_result(
+        self, query: str, key: str, use_cache: bool, guard: bool
+    ) -> Tuple[Optional[pd.DataFrame], Dict[str, Any]]:
         if use_cache:
-            cached_response = self.get_from_cache(query)
+            cached_response = self.get_from_cache(key)
             if cached_response:
-                return json.loads(cached_response)
+                try:
+                    result_frame, meta = decode_result(cached_response)
+                except ResultCodecError as e:
+                    # Older format version or corrupt payload: recompute and overwrite
+                    print(f"Ignoring cached result: {e}")
+                else:
+                    tables = [tuple(table) for table in meta.get("tables", [])]
+                    cached_at = meta.get("cached_at", 0.0)
+                    if self.cache_invalidator.is_fresh(tables, cached_at):
+                        self.cache_invalidator.track(key, tables, cached_at)
+                        self.result_cache.set(
+                            key, (result_frame, meta), nbytes=frame_nbytes(result_frame)
+                        )
+                        return result_frame, meta
+                    print("Ignoring cached result: its tables changed since it was cached")
+
+        # Taken before the query runs, so changes made while it runs invalidate the result
+        cached_at = time.time()
 
-        session = self.get_session()
-        result = session.sql(query).collect()
-        result_list = [row.as_dict() for row in result]
+        meta: Dict[str, Any] = {}
+        with self.session_pool.session() as session:
+            run_query = query
+            if guard:
+                # EXPLAIN runs on the session the query then runs on, so a miss costs
+                # one checkout
+                decision = self.cost_guard.check(session, query)
+                print(decision.report())
+                meta["cost_guard"] = decision.report()
+                if decision.rejected:
+                    return None, meta
+                run_query = decision.query
+
+            # Rows are streamed in pandas batches and fetching stops at the row/byte cap
+            pager = ResultPager(
+                session.sql(run_query).to_pandas_batches(),
+                max_rows=self.max_rows,
+                max_bytes=self.max_bytes,
+            )
+            result_frame = pager.read_all()
+            pager.close()
+        # A result that fills the LIMIT the guard injected may be missing rows too; the
+        # entry is keyed on the original query, so every later reader must see that
+        limited = run_query != query and len(result_frame) >= self.cost_guard.budget.limit_rows
+        meta.update(
+            truncated=pager.truncated or limited, rows_fetched=pager.rows_fetched
+        )
 
         if use_cache:
-            self.set_to_cache(query, result_list)
+            tables, complete = scan_tables(
+                query,
+                self.connection_parameters["database"],
+                self.connection_parameters["schema"],
+            )
+            if not complete:
+                print("Caching the result briefly: could not tell every table it reads")
+                self.result_cache.set(
+                    key,
+                    (result_frame, meta),
+                    ttl=self.untracked_result_ttl,
+                    nbytes=frame_nbytes(result_frame),
+                )
+                return result_frame, meta
+            meta.update(tables=sorted(tables), cached_at=cached_at)
+            self.cache_invalidator.track(key, tables, cached_at)
+            self.result_cache.set(
+                key, (result_frame, meta), nbytes=frame_nbytes(result_frame)
+            )
+            # Serializing and shipping to KV happen off the request path
+            self.cache_writer.submit(key, (result_frame, meta))
+
+        return result_frame, meta
 
-        return result_list
+    def execute_guarded(
+        self, query: str, use_cache: bool = True
+    ) -> Tuple[Optional[pd.DataFrame], Dict[str, Any]]:
+        """
+        Same as ``execute_query_result`` with the cost guard on, unless SQL_GUARD is off.
+        Cached results are returned without a round trip to Snowflake; only a miss is checked
+        with EXPLAIN first.
+        """
+        return self.execute_query_result(query, use_cache, guard=sql_guard_enabled())
+
+    async def aexecute_query(self, query: str, use_cache: bool = True) -> str:
+        """
+        Async variant of ``execute_query``. Snowpark is synchronous, so the query runs on the
+        bounded executor of ``utils.async_runtime`` and only the awaiting task is suspended.
+        """
+        return await run_blocking(self.execute_query, query, use_cache)
+
+    def cache_stats(self) -> Dict[str, Any]:
+        """
+        Returns hit, miss and eviction counters and the current size of the in-process cache,
+        with the background writer's queue depth and lag and the KV client's counters.
+        """
+        stats = self.result_cache.stats.as_dict()
+        stats["entries"] = len(self.result_cache)
+        stats["bytes"] = self.result_cache.current_bytes
+        stats["max_bytes"] = self.result_cache.max_bytes
+        stats["write_behind"] = self.cache_writer.stats()
+        stats["kv"] = self.kv.stats()
+        stats["invalidation"] = self.cache_invalidator.stats()
+        stats["single_flight"] = query_flights.stats()
+        return stats
@@ -1,5 +1,7 @@
+import functools
 import html
 import re
+import time
 
 import streamlit as st
 from langchain.callbacks.base import BaseCallbackHandler
@@ -22,25 +24,30 @@ qwen_url = image_url + "qwen.png?t=2024-06-07T08%3A51%3A36.363Z"
 deepseek_url = image_url + "/deepseek-color.png"
 grok_url = image_url + "/xAI-logo.jpg"
 
+# Checked in order, the first keyword contained in the lowercased model name wins
+model_avatars = (
+    ("qwen", qwen_url),
+    ("claude", claude_url),
+    ("llama", meta_url),
+    ("gemma", gemini_url),
+    ("arctic", snow_url),
+    ("gpt", openai_url),
+    ("o3", openai_url),
+    ("gemini", gemini_url),
+    ("deepseek", deepseek_url),
+    ("grok", grok_url),
+)
+
+CODE_BLOCK_PATTERN = re.compile(r"```([\s\S]*?)```")
+CODE_BLOCK_HTML = '<pre style="white-space: pre-wrap; word-wrap: break-word;"><code>{}</code></pre>'
+
+
+@functools.lru_cache(maxsize=64)
 def get_model_url(model_name):
-    if "qwen" in model_name.lower():
-        return qwen_url
-    elif "claude" in model_name.lower():
-        return claude_url
-    elif "llama" in model_name.lower():
-        return meta_url
-    elif "gemma" in model_name.lower():
-        return gemini_url
-    elif "arctic" in model_name.lower():
-        return snow_url
-    elif "gpt" in model_name.lower() or "o3" in model_name.lower():
-        return openai_url
-    elif "gemini" in model_name.lower():
-        return gemini_url
-    elif "deepseek" in model_name.lower():
-        return deepseek_url
-    elif "grok" in model_name.lower():
-        return grok_url
+    model_name = model_name.lower()
+    for keyword, url in model_avatars:
+        if keyword in model_name:
+            return url
     return mistral_url
 
 
@@ -51,18 +58,74 @@ def format_message(text):
     Parameters:
     text (str): The text to be formatted.
     """
-    text_blocks = re.split(r"```[\s\S]*?```", text)
-    code_blocks = re.findall(r"```([\s\S]*?)```", text)
+    # With a capturing group, split alternates text blocks (even) and code blocks (odd)
+    blocks = CODE_BLOCK_PATTERN.split(text)
+
+    formatted_text = []
+    for i, block in enumerate(blocks):
+        if i % 2:
+            formatted_text.append(CODE_BLOCK_HTML.format(html.escape(block)))
+        else:
+            formatted_text.append(html.escape(block).replace("\n", "<br>"))
+
+    return "".join(formatted_text)
+
+
+class IncrementalFormatter:
+    """
+    Builds ``format_message(text.strip())`` for a text that arrives in pieces.
+
+    Completed parts (closed code blocks, text before a code fence, and text lines followed by
+    more content) are formatted once and kept; only the open trailing part is formatted again
+    on each ``render``, so streaming an answer costs O(n) instead of O(n^2).
+    """
 
-    text_blocks = [html.escape(block) for block in text_blocks]
+    def __init__(self):
+        self._tokens = []
+        self.length = 0
+        self._html = ""
+        self._pending = ""
+        self._scan_from = 3
 
-    formatted_text = ""
-    for i in range(len(text_blocks)):
-        formatted_text += text_blocks[i].replace("\n", "<br>")
-        if i < len(code_blocks):
-            formatted_text += f'<pre style="white-space: pre-wrap; word-wrap: break-word;"><code>{html.escape(code_blocks[i])}</code></pre>'
+    @property
+    def text(self):
+        return "".join(self._tokens)
 
-    return formatted_text
+    def append(self, token):
+        self._tokens.append(token)
+        self.length += len(token)
+        if not self._html and not self._pending:
+            token = token.lstrip()
+        self._pending += token
+        self._commit()
+
+    def render(self):
+        return self._html + format_message(self._pending.rstrip())
+
+    def _commit(self):
+        while self._pending:
+            if self._pending.startswith("```"):
+                end = self._pending.find("```", self._scan_from)
+                if end == -1:
+                    # A fence may be split across tokens, so rescan its first two characters
+                    self._scan_from = max(3, len(self._pending) - 2)
+                    return
+                self._push(self._pending[: end + 3])
+                continue
+            start = self._pending.find("```")
+            if start != -1:
+                self._push(self._pending[:start])
+                continue
+            # Lines followed by non-whitespace text are not affected by the final strip()
+            cut = self._pending.rstrip().rfind("\n") + 1
+            if cut:
+                self._push(self._pending[:cut])
+            return
+
+    def _push(self, block):
+        self._html += format_message(block)
+        self._pending = self._pending[len(block) :]
+        self._scan_from = 3
 
 
 def message_func(text, is_user=False, is_df=False, model="gpt"):
@@ -74,19 +137,31 @@ def message_func(text, is_user=False, is_df=False, model="gpt"):
     is_user (bool): Whether the message is from the user or not.
     is_df (bool): Whether the message is a dataframe or not.
     """
-    model_url = get_model_url(model)
+    if is_df:
+        st.write(text)
+        return
+    container_html = render_message_html(text, is_user, get_model_url(model))
+    if container_html:  # Empty messages are not displayed
+        st.write(container_html, unsafe_allow_html=True)
+
+
+@functools.lru_cache(maxsize=2048)
+def render_message_html(text, is_user, model_url):
+    """
+    Builds the HTML of one chat bubble. History is replayed on every rerun, so the result
+    is memoized per message text, sender and avatar.
+    """
     avatar_url = user_url if is_user else model_url
     message_bg_color = (
         "linear-gradient(135deg, #00B2FF 0%, #006AFF 100%)" if is_user else "#71797E"
     )
     avatar_class = "user-avatar" if is_user else "bot-avatar"
-    alignment = "flex-end" if is_user else "flex-start"
-    margin_side = "margin-left" if is_user else "margin-right"
     message_text = html.escape(text.strip()).replace('\n', '<br>')
 
-    if message_text:  # Check if message_text is not empty
-        if is_user:
-            container_html = f"""
+    if not message_text:
+        return ""
+    if is_user:
+        return f"""
             <div style="display:flex; align-items:flex-start; justify-content:flex-end; margin:0; padding:0; margin-bottom:10px;">
                 <div style="background:{message_bg_color}; color:white; border-radius:20px; padding:10px; margin-right:5px; max-width:75%; font-size:14px; margin:0; line-height:1.2; word-wrap:break-word;">
                     {message_text}
@@ -94,8 +169,7 @@ def message_func(text, is_user=False, is_df=False, model="gpt"):
                 <img src="{avatar_url}" class="{avatar_class}" alt="avatar" style="width:40px; height:40px; margin:0;" />
             </div>
             """
-        else:
-            container_html = f"""
+    return f"""
             <div style="display:flex; align-items:flex-start; justify-content:flex-start; margin:0; padding:0; margin-bottom:10px;">
                 <img src="{avatar_url}" class="{avatar_class}" alt="avatar" style="width:30px; height:30px; margin:0; margin-right:5px; margin-top:5px;" />
                 <div style="background:{message_bg_color}; color:white; border-radius:20px; padding:10px; margin-left:5px; max-width:75%; font-size:14px; margin:0; line-height:1.2; word-wrap:break-word;">
@@ -103,19 +177,30 @@ def message_func(text, is_user=False, is_df=False, model="gpt"):
                 </div>
             </div>
             """
-        st.write(container_html, unsafe_allow_html=True)
-
 
 
 class StreamlitUICallbackHandler(BaseCallbackHandler):
-    def __init__(self, model):
-        self.token_buffer = []
+    """
+    Streams LLM tokens into a chat bubble.
+
+    Parameters:
+    model (str): The model name, used to pick the avatar.
+    render_interval (float): Minimum seconds between two UI updates while streaming.
+    min_render_chars (int): Minimum number of new characters before the UI is updated.
+    """
+
+    def __init__(self, model, render_interval=1 / 15, min_render_chars=1):
+        self.formatter = IncrementalFormatter()
         self.placeholder = st.empty()
         self.has_streaming_ended = False
         self.has_streaming_started = False
         self.model = model
         self.avatar_url = get_model_url(model)
         self.final_message = ""
+        self.render_interval = render_interval
+        self.min_render_chars = min_render_chars
+        self._last_render = 0.0
+        self._rendered_chars = 0
 
     def start_loading_message(self):
         loading_message_content = self._get_bot_message_container("Thinking...")
@@ -125,20 +210,42 @@ class StreamlitUICallbackHandler(BaseCallbackHandler):
         if not self.has_streaming_started:
             self.has_streaming_started = True
 
-        self.token_buffer.append(token)
-        complete_message = "".join(self.token_buffer)
-        container_content = self._get_bot_message_container(complete_message)
-        self.placeholder.markdown(container_content, unsafe_allow_html=True)
-        self.final_message = "".join(self.token_buffer)
+        self.formatter.append(token)
+        if (
+            self.formatter.length - self._rendered_chars >= self.min_render_chars
+            and time.monotonic() - self._last_render >= self.render_interval
+        ):
+            self._render()
 
     def on_llm_end(self, response, run_id, parent_run_id=None, **kwargs):
-        self.token_buffer = []
+        if self.formatter.length:
+            if self.formatter.length != self._rendered_chars:
+                self._render()
+            self.final_message = self.formatter.text
+        self.formatter = IncrementalFormatter()
+        self._rendered_chars = 0
         self.has_streaming_ended = True
         self.has_streaming_started = False
 
+    def _render(self):
+        """Pushes the current message to the browser, coalescing the tokens since the last update."""
+        self.placeholder.markdown(
+            self._bot_message_html(self.formatter.render()), unsafe_allow_html=True
+        )
+        self._last_render = time.monotonic()
+        self._rendered_chars = self.formatter.length
+
+    def replay(self, text, chunk_size=40):
+        """Renders a cached answer as if it had been streamed, in chunks of ``chunk_size`` characters."""
+        for start in range(0, len(text), chunk_size):
+            self.on_llm_new_token(text[start : start + chunk_size], run_id=None)
+        self.on_llm_end(None, run_id=None)
+
     def _get_bot_message_container(self, text):
         """Generate the bot's message container style for the given text."""
-        formatted_text = format_message(text.strip())
+        return self._bot_message_html(format_message(text.strip()))
+
+    def _bot_message_html(self, formatted_text):
         if not formatted_text:  # If no formatted text, show "Thinking..."
             formatted_text = "Thinking..."
         container_content = f"""
@@ -1,29 +1,80 @@
+import json
+import os
+import threading
+
+DDL_MANIFEST_PATH = "sql/ddl_manifest.json"
+
+DEFAULT_DDL_FILES = {
+    "TRANSACTIONS": "sql/ddl_transactions.sql",
+    "ORDER_DETAILS": "sql/ddl_orders.sql",
+    "PAYMENTS": "sql/ddl_payments.sql",
+    "PRODUCTS": "sql/ddl_products.sql",
+    "CUSTOMER_DETAILS": "sql/ddl_customer.sql",
+}
+
+
 class Snowddl:
     """
-    Snowddl class loads DDL files for various tables in a database.
+    Snowddl class is a lazily populated, thread-safe registry of DDL files for the tables
+    in a database. Meant to be shared by the whole process.
+
+    A DDL file is only read the first time its table is requested and is re-read when its
+    modification time changes. The table -> file mapping itself is reloaded when the DDL
+    manifest written by harvest.py changes.
 
     Attributes:
-        ddl_dict (dict): dictionary of DDL files for various tables in a database.
+        ddl_dict (dict): DDL of every table; reads all files, prefer get_ddl for one table.
 
     Methods:
-        load_ddls: loads DDL files for various tables in a database.
+        table_names: returns the names of all known tables.
+        get_ddl: returns the DDL for one table.
+        load_ddls: loads DDL files for all tables in a database.
     """
 
-    def __init__(self):
-        self.ddl_dict = self.load_ddls()
-
-    @staticmethod
-    def load_ddls():
-        ddl_files = {
-            "TRANSACTIONS": "sql/ddl_transactions.sql",
-            "ORDER_DETAILS": "sql/ddl_orders.sql",
-            "PAYMENTS": "sql/ddl_payments.sql",
-            "PRODUCTS": "sql/ddl_products.sql",
-            "CUSTOMER_DETAILS": "sql/ddl_customer.sql",
-        }
-
-        ddl_dict = {}
-        for table_name, file_name in ddl_files.items():
+    def __init__(self, manifest_path: str = DDL_MANIFEST_PATH):
+        self.manifest_path = manifest_path
+        self._lock = threading.Lock()
+        self._ddl_files = {}
+        self._manifest_mtime = None
+        self._cache = {}
+
+    @property
+    def ddl_dict(self):
+        return self.load_ddls()
+
+    def table_names(self):
+        with self._lock:
+            return list(self._files())
+
+    def get_ddl(self, table_name: str) -> str:
+        with self._lock:
+            file_name = self._files()[table_name]
+            mtime = os.path.getmtime(file_name)
+            cached = self._cache.get(table_name)
+            if cached is not None and cached[0] == file_name and cached[1] == mtime:
+                return cached[2]
             with open(file_name, "r") as f:
-                ddl_dict[table_name] = f.read()
-        return ddl_dict
+                ddl = f.read()
+            self._cache[table_name] = (file_name, mtime, ddl)
+            return ddl
+
+    def load_ddls(self):
+        return {table_name: self.get_ddl(table_name) for table_name in self.table_names()}
+
+    def _files(self):
+        """
+        Maps table names to DDL files; must be called with the lock held. Tables generated
+        by harvest.py are listed in the DDL manifest and take precedence over the defaults.
+        """
+        mtime = (
+            os.path.getmtime(self.manifest_path)
+            if os.path.exists(self.manifest_path)
+            else None
+        )
+        if not self._ddl_files or mtime != self._manifest_mtime:
+            ddl_files = dict(DEFAULT_DDL_FILES)
+            if mtime is not None:
+                with open(self.manifest_path, "r") as f:
+                    ddl_files.update(json.load(f))
+            self._ddl_files, self._manifest_mtime = ddl_files, mtime
+        return self._ddl_files
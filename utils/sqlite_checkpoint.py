@@ -0,0 +1,148 @@
+import sqlite3
+import time
+from typing import Any, Optional
+
+from langchain_core.runnables import RunnableConfig
+from langgraph.checkpoint.sqlite import SqliteSaver
+
+from utils.async_runtime import run_blocking
+from utils.checkpoint import trim_checkpoint_messages
+
+
+class BoundedSqliteSaver(SqliteSaver):
+    """
+    SQLite checkpointer with the bounds of ``BoundedMemorySaver``, so the database does not
+    grow with total traffic.
+
+    - Only the newest ``keep_checkpoints`` checkpoints of each thread are kept, together with
+      their pending writes.
+    - The ``messages`` channel of a stored checkpoint is capped at ``max_messages``.
+    - At most ``max_threads`` threads are kept; the least recently active thread is evicted
+      first, and threads idle for longer than ``idle_ttl`` seconds are evicted as well.
+      Activity is recorded on every checkpoint write in a ``thread_activity`` table, so the
+      bounds hold across restarts and across processes sharing the file.
+
+    The async methods run the sync ones on the bounded executor of ``utils.async_runtime``,
+    so the saver also works with the async agent mode.
+    """
+
+    def __init__(
+        self,
+        conn: sqlite3.Connection,
+        max_threads: int = 500,
+        max_messages: int = 60,
+        keep_checkpoints: int = 2,
+        idle_ttl: Optional[float] = 6 * 60 * 60,
+        **kwargs: Any,
+    ):
+        super().__init__(conn, **kwargs)
+        self.max_threads = max_threads
+        self.max_messages = max_messages
+        self.keep_checkpoints = keep_checkpoints
+        self.idle_ttl = idle_ttl
+
+    def setup(self) -> None:
+        if self.is_setup:
+            return
+        super().setup()
+        self.conn.executescript(
+            """
+            CREATE TABLE IF NOT EXISTS thread_activity (
+                thread_id TEXT PRIMARY KEY,
+                last_active REAL NOT NULL
+            );
+            CREATE INDEX IF NOT EXISTS thread_activity_last_active
+                ON thread_activity (last_active);
+            """
+        )
+        # Threads stored before activity was tracked count as active now
+        self.conn.execute(
+            "INSERT OR IGNORE INTO thread_activity (thread_id, last_active) "
+            "SELECT DISTINCT thread_id, ? FROM checkpoints",
+            (time.time(),),
+        )
+        self.conn.commit()
+
+    def put(self, config, checkpoint, metadata, new_versions):
+        checkpoint = trim_checkpoint_messages(checkpoint, self.max_messages)
+        saved = super().put(config, checkpoint, metadata, new_versions)
+        thread_id = str(config["configurable"]["thread_id"])
+        checkpoint_ns = config["configurable"].get("checkpoint_ns", "")
+        now = time.time()
+        with self.cursor() as cur:
+            self._prune(cur, thread_id, checkpoint_ns)
+            cur.execute(
+                "INSERT OR REPLACE INTO thread_activity (thread_id, last_active) VALUES (?, ?)",
+                (thread_id, now),
+            )
+            self._evict(cur, now)
+        return saved
+
+    def evict_thread(self, thread_id: str) -> None:
+        with self.cursor() as cur:
+            self._delete_thread(cur, str(thread_id))
+
+    def stats(self) -> dict:
+        with self.cursor(transaction=False) as cur:
+            threads = cur.execute("SELECT COUNT(*) FROM thread_activity").fetchone()[0]
+            checkpoints = cur.execute("SELECT COUNT(*) FROM checkpoints").fetchone()[0]
+            writes = cur.execute("SELECT COUNT(*) FROM writes").fetchone()[0]
+        return {"threads": threads, "checkpoints": checkpoints, "writes": writes}
+
+    async def aget_tuple(self, config: RunnableConfig):
+        return await run_blocking(self.get_tuple, config)
+
+    async def alist(self, config, *, filter=None, before=None, limit=None):
+        items = await run_blocking(
+            lambda: list(self.list(config, filter=filter, before=before, limit=limit))
+        )
+        for item in items:
+            yield item
+
+    async def aput(self, config, checkpoint, metadata, new_versions):
+        return await run_blocking(self.put, config, checkpoint, metadata, new_versions)
+
+    async def aput_writes(self, config, writes, task_id, *args, **kwargs):
+        return await run_blocking(self.put_writes, config, writes, task_id, *args, **kwargs)
+
+    def _prune(self, cur: sqlite3.Cursor, thread_id: str, checkpoint_ns: str) -> None:
+        # Checkpoint ids are time-ordered, so sorting them orders checkpoints by age.
+        stale = [
+            (thread_id, checkpoint_ns, row[0])
+            for row in cur.execute(
+                "SELECT checkpoint_id FROM checkpoints WHERE thread_id = ? AND checkpoint_ns = ? "
+                "ORDER BY checkpoint_id DESC LIMIT -1 OFFSET ?",
+                (thread_id, checkpoint_ns, self.keep_checkpoints),
+            ).fetchall()
+        ]
+        if not stale:
+            return
+        where = "WHERE thread_id = ? AND checkpoint_ns = ? AND checkpoint_id = ?"
+        cur.executemany(f"DELETE FROM checkpoints {where}", stale)
+        cur.executemany(f"DELETE FROM writes {where}", stale)
+
+    def _evict(self, cur: sqlite3.Cursor, now: float) -> None:
+        evicted = set()
+        if self.idle_ttl is not None:
+            evicted.update(
+                row[0]
+                for row in cur.execute(
+                    "SELECT thread_id FROM thread_activity WHERE last_active < ?",
+                    (now - self.idle_ttl,),
+                ).fetchall()
+            )
+        evicted.update(
+            row[0]
+            for row in cur.execute(
+                "SELECT thread_id FROM thread_activity ORDER BY last_active DESC "
+                "LIMIT -1 OFFSET ?",
+                (self.max_threads,),
+            ).fetchall()
+        )
+        for thread_id in evicted:
+            self._delete_thread(cur, thread_id)
+
+    @staticmethod
+    def _delete_thread(cur: sqlite3.Cursor, thread_id: str) -> None:
+        for table in ("checkpoints", "writes", "thread_activity"):
+            cur.execute(f"DELETE FROM {table} WHERE thread_id = ?", (thread_id,))
@@ -0,0 +1,81 @@
+import functools
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Iterator, List, Set, Tuple, TypeVar
+
+T = TypeVar("T")
+
+_timings: List[Tuple[str, str, float]] = []
+_recorded: Set[Tuple[str, str]] = set()
+_timings_lock = threading.Lock()
+_process_started = time.perf_counter()
+
+
+@contextmanager
+def timed(name: str, kind: str = "import") -> Iterator[None]:
+    """
+    Records how long the enclosed block takes in the startup report. Only the first run of
+    a block is recorded, so blocks in the Streamlit script do not add an entry per rerun.
+    For a full per-module breakdown of imports run ``python -X importtime``.
+    """
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        elapsed = time.perf_counter() - started
+        with _timings_lock:
+            if (kind, name) not in _recorded:
+                _recorded.add((kind, name))
+                _timings.append((kind, name, elapsed))
+
+
+def lazy(name: str) -> Callable[[Callable[[], T]], Callable[[], T]]:
+    """
+    Turns a zero-argument factory into a thread-safe, build-once accessor. The object is
+    only constructed on first call, and the time that takes is recorded in the startup report.
+    """
+
+    def decorator(factory: Callable[[], T]) -> Callable[[], T]:
+        lock = threading.Lock()
+        instance: List[T] = []
+
+        @functools.wraps(factory)
+        def get() -> T:
+            if not instance:
+                with lock:
+                    if not instance:
+                        with timed(name, kind="init"):
+                            instance.append(factory())
+            return instance[0]
+
+        get.is_initialized = lambda: bool(instance)
+        return get
+
+    return decorator
+
+
+def startup_report(stage: str = "") -> str:
+    with _timings_lock:
+        timings = list(_timings)
+    title = f"Startup report, {stage}" if stage else "Startup report"
+    lines = [f"{title} ({time.perf_counter() - _process_started:.3f}s since first import)"]
+    for kind, name, seconds in timings:
+        lines.append(f"  {kind:<6} {seconds * 1000:9.1f} ms  {name}")
+    return "\n".join(lines)
+
+
+_reported = set()
+
+
+def print_startup_report_once(stage: str = "first run") -> None:
+    """
+    Prints the startup report the first time ``stage`` is reached in this process. Lazy
+    clients are built on the first question, so their init timings only show up in a
+    report printed after the first answer.
+    """
+    with _timings_lock:
+        if stage in _reported:
+            return
+        _reported.add(stage)
+    print(startup_report(stage))
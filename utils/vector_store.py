@@ -0,0 +1,272 @@
+import json
+import os
+from typing import Any, Dict, Iterable, List, Optional, Sequence, Tuple
+from uuid import uuid4
+
+import numpy as np
+from langchain_community.vectorstores import SupabaseVectorStore
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from utils.async_runtime import run_blocking
+
+DEFAULT_LOCAL_INDEX_PATH = "vector_index/schema"
+
+
+class SchemaVectorStore(SupabaseVectorStore):
+    """
+    Supabase vector store that pushes top-k and the similarity threshold down into the
+    ``v_match_documents`` function from supabase/scripts.sql.
+
+    The stock ``SupabaseVectorStore`` only applies ``k`` as a PostgREST limit on the rows the
+    function returns, so the function itself has no LIMIT and cannot use the HNSW index.
+    """
+
+    def __init__(self, *args: Any, min_similarity: float = 0.0, **kwargs: Any):
+        super().__init__(*args, **kwargs)
+        self.min_similarity = min_similarity
+
+    def match_args(
+        self,
+        query: List[float],
+        filter: Optional[Dict[str, Any]],
+        k: int = 4,
+        score_threshold: Optional[float] = None,
+    ) -> Dict[str, Any]:
+        args = super().match_args(query, filter)
+        args["match_count"] = k
+        args["min_similarity"] = (
+            score_threshold if score_threshold is not None else self.min_similarity
+        )
+        return args
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self,
+        query: List[float],
+        k: int,
+        filter: Optional[Dict[str, Any]] = None,
+        postgrest_filter: Optional[str] = None,
+        score_threshold: Optional[float] = None,
+    ) -> List[Tuple[Document, float]]:
+        params = self.match_args(query, filter, k=k, score_threshold=score_threshold)
+        query_builder = self._client.rpc(self.query_name, params)
+
+        if postgrest_filter:
+            query_builder.params = query_builder.params.set(
+                "and", f"({postgrest_filter})"
+            )
+
+        res = query_builder.execute()
+
+        return [
+            (
+                Document(
+                    metadata=search.get("metadata", {}),
+                    page_content=search.get("content", ""),
+                ),
+                search.get("similarity", 0.0),
+            )
+            for search in res.data
+            if search.get("content")
+        ]
+
+    async def asimilarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        # The Supabase client is synchronous; run it on the bounded executor so concurrent
+        # schema lookups from one LLM turn overlap without unbounded thread growth.
+        return await run_blocking(
+            self.similarity_search_with_relevance_scores, query, k, **kwargs
+        )
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store for small corpora such as the schema docs.
+
+    Embeddings are L2-normalized and kept as a float32 matrix in ``<index_path>.npy``, which
+    is memory-mapped read-only on load, so similarity is a single matrix-vector product.
+    Document contents, metadata and ids live next to it in ``<index_path>.json``.
+    Changes made with ``add_texts``/``add_vectors``/``delete`` are held in memory until
+    ``save`` is called.
+    """
+
+    def __init__(self, embedding: Embeddings, index_path: str = DEFAULT_LOCAL_INDEX_PATH):
+        self._embedding = embedding
+        self.index_path = index_path
+        self._matrix: Optional[np.ndarray] = None
+        self._records: List[Dict[str, Any]] = []
+        self.load()
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+    @property
+    def _matrix_path(self) -> str:
+        return f"{self.index_path}.npy"
+
+    @property
+    def _records_path(self) -> str:
+        return f"{self.index_path}.json"
+
+    def __len__(self) -> int:
+        return len(self._records)
+
+    def ids(self) -> List[str]:
+        return [record["id"] for record in self._records]
+
+    def load(self) -> None:
+        if not os.path.exists(self._matrix_path):
+            self._matrix, self._records = None, []
+            return
+        self._matrix = np.load(self._matrix_path, mmap_mode="r")
+        with open(self._records_path, "r") as f:
+            self._records = json.load(f)
+
+    def save(self) -> None:
+        """Atomically writes the index files and re-opens the matrix as a memory map."""
+        directory = os.path.dirname(self.index_path)
+        if directory:
+            os.makedirs(directory, exist_ok=True)
+        matrix = self._matrix if self._matrix is not None else np.zeros((0, 0), np.float32)
+
+        with open(f"{self._matrix_path}.tmp", "wb") as f:
+            np.save(f, np.ascontiguousarray(matrix, dtype=np.float32))
+        with open(f"{self._records_path}.tmp", "w") as f:
+            json.dump(self._records, f)
+        os.replace(f"{self._matrix_path}.tmp", self._matrix_path)
+        os.replace(f"{self._records_path}.tmp", self._records_path)
+        self.load()
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None,
+        **kwargs: Any,
+    ) -> List[str]:
+        texts = list(texts)
+        metadatas = metadatas or [{} for _ in texts]
+        documents = [
+            Document(page_content=text, metadata=metadata)
+            for text, metadata in zip(texts, metadatas)
+        ]
+        vectors = self._embedding.embed_documents(texts)
+        return self.add_vectors(vectors, documents, ids=ids)
+
+    def add_vectors(
+        self,
+        vectors: Sequence[Sequence[float]],
+        documents: Sequence[Document],
+        ids: Optional[List[str]] = None,
+    ) -> List[str]:
+        """Inserts the given vectors, replacing any existing rows with the same ids."""
+        ids = ids or [str(uuid4()) for _ in documents]
+        if not ids:
+            return []
+        new_rows = self._normalize(np.asarray(vectors, dtype=np.float32))
+
+        replaced = set(ids)
+        keep = [i for i, record in enumerate(self._records) if record["id"] not in replaced]
+        records = [self._records[i] for i in keep]
+        if self._matrix is not None and len(self._matrix):
+            rows = np.concatenate([np.asarray(self._matrix[keep]), new_rows])
+        else:
+            rows = new_rows
+
+        for id_, document in zip(ids, documents):
+            records.append(
+                {
+                    "id": id_,
+                    "content": document.page_content,
+                    "metadata": document.metadata,
+                }
+            )
+        self._matrix, self._records = rows, records
+        return list(ids)
+
+    def delete(self, ids: Optional[List[str]] = None, **kwargs: Any) -> Optional[bool]:
+        if not ids:
+            return False
+        removed = set(ids)
+        keep = [i for i, record in enumerate(self._records) if record["id"] not in removed]
+        if len(keep) == len(self._records):
+            return False
+        self._records = [self._records[i] for i in keep]
+        self._matrix = np.asarray(self._matrix[keep]) if self._matrix is not None else None
+        return True
+
+    def batch_similarity_search_by_vectors(
+        self, vectors: Sequence[Sequence[float]], k: int = 4
+    ) -> List[List[Tuple[Document, float]]]:
+        """Top-k search for several query vectors with one matrix-matrix product."""
+        queries = self._normalize(np.asarray(vectors, dtype=np.float32))
+        if self._matrix is None or not len(self._records):
+            return [[] for _ in range(len(queries))]
+
+        scores = queries @ self._matrix.T
+        k = min(k, scores.shape[1])
+        top = np.argpartition(-scores, k - 1, axis=1)[:, :k]
+        results = []
+        for row, candidates in zip(scores, top):
+            ordered = candidates[np.argsort(-row[candidates])]
+            results.append([(self._document(i), float(row[i])) for i in ordered])
+        return results
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self,
+        embedding: Sequence[float],
+        k: int = 4,
+        score_threshold: Optional[float] = None,
+    ) -> List[Tuple[Document, float]]:
+        results = self.batch_similarity_search_by_vectors([embedding], k=k)[0]
+        if score_threshold is not None:
+            results = [(doc, score) for doc, score in results if score >= score_threshold]
+        return results
+
+    def similarity_search_by_vector(
+        self, embedding: List[float], k: int = 4, **kwargs: Any
+    ) -> List[Document]:
+        results = self.similarity_search_by_vector_with_relevance_scores(
+            embedding, k=k, score_threshold=kwargs.get("score_threshold")
+        )
+        return [doc for doc, _ in results]
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> List[Document]:
+        embedding = self._embedding.embed_query(query)
+        return self.similarity_search_by_vector(embedding, k=k, **kwargs)
+
+    def _similarity_search_with_relevance_scores(
+        self, query: str, k: int = 4, **kwargs: Any
+    ) -> List[Tuple[Document, float]]:
+        embedding = self._embedding.embed_query(query)
+        return self.similarity_search_by_vector_with_relevance_scores(embedding, k=k)
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: List[str],
+        embedding: Embeddings,
+        metadatas: Optional[List[Dict[str, Any]]] = None,
+        ids: Optional[List[str]] = None,
+        index_path: str = DEFAULT_LOCAL_INDEX_PATH,
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        store = cls(embedding, index_path=index_path)
+        store.add_texts(texts, metadatas=metadatas, ids=ids)
+        store.save()
+        return store
+
+    def _document(self, index: int) -> Document:
+        record = self._records[index]
+        return Document(
+            page_content=record["content"], metadata=record.get("metadata", {})
+        )
+
+    @staticmethod
+    def _normalize(vectors: np.ndarray) -> np.ndarray:
+        vectors = np.atleast_2d(vectors)
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        norms[norms == 0] = 1.0
+        return vectors / norms
@@ -0,0 +1,107 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+
+
+class WriteBehindQueue:
+    """
+    Bounded queue of cache writes shipped by a background thread.
+
+    ``submit`` never blocks: a write for a key that is still pending replaces the pending
+    value (coalescing), and when ``max_pending`` distinct keys are waiting new keys are
+    dropped. Writes are applied in submission order by a single worker, so a newer value for
+    a key can never be overwritten by an older one. ``close`` flushes what is pending.
+
+    Parameters
+    ----------
+    write : Callable[[Hashable, Any], None]
+        Ships one write; an exception counts the write as failed.
+    max_pending : int
+        Maximum number of distinct keys waiting to be written.
+    """
+
+    def __init__(
+        self,
+        write: Callable[[Hashable, Any], None],
+        max_pending: int = 256,
+        name: str = "write-behind",
+    ):
+        self.write = write
+        self.max_pending = max_pending
+        self._pending: "OrderedDict[Hashable, Tuple[Any, float]]" = OrderedDict()
+        self._in_flight = 0
+        self._closed = False
+        self._condition = threading.Condition()
+        self._stats = {
+            "submitted": 0,
+            "coalesced": 0,
+            "dropped": 0,
+            "written": 0,
+            "failed": 0,
+        }
+        self._last_lag = 0.0
+        self._worker = threading.Thread(target=self._run, name=name, daemon=True)
+        self._worker.start()
+
+    def submit(self, key: Hashable, value: Any) -> bool:
+        """Queues a write and returns False if it was dropped."""
+        with self._condition:
+            if self._closed:
+                self._stats["dropped"] += 1
+                return False
+            if key in self._pending:
+                # Keep the original enqueue time so lag reflects the oldest waiting write
+                self._pending[key] = (value, self._pending[key][1])
+                self._stats["coalesced"] += 1
+                return True
+            if len(self._pending) >= self.max_pending:
+                self._stats["dropped"] += 1
+                return False
+            self._pending[key] = (value, time.monotonic())
+            self._stats["submitted"] += 1
+            self._condition.notify_all()
+            return True
+
+    def flush(self, timeout: Optional[float] = None) -> bool:
+        """Waits until every queued write has been shipped; returns False on timeout."""
+        with self._condition:
+            return self._condition.wait_for(
+                lambda: not self._pending and not self._in_flight, timeout
+            )
+
+    def close(self, timeout: Optional[float] = 10.0) -> None:
+        """Ships pending writes (waiting at most ``timeout`` seconds) and stops the worker."""
+        with self._condition:
+            self._closed = True
+            self._condition.notify_all()
+        self._worker.join(timeout)
+
+    def stats(self) -> Dict[str, Any]:
+        with self._condition:
+            stats = dict(self._stats)
+            stats["depth"] = len(self._pending)
+            oldest = next(iter(self._pending.values()), None)
+            stats["lag"] = time.monotonic() - oldest[1] if oldest else 0.0
+            stats["last_write_lag"] = self._last_lag
+        return stats
+
+    def _run(self) -> None:
+        while True:
+            with self._condition:
+                self._condition.wait_for(lambda: self._pending or self._closed)
+                if not self._pending:
+                    return
+                key, (value, enqueued_at) = self._pending.popitem(last=False)
+                self._in_flight += 1
+            try:
+                self.write(key, value)
+                outcome = "written"
+            except Exception as e:
+                print(f"Background cache write failed: {e}")
+                outcome = "failed"
+            with self._condition:
+                self._in_flight -= 1
+                self._stats[outcome] += 1
+                self._last_lag = time.monotonic() - enqueued_at
+                self._condition.notify_all()